@@ -0,0 +1,177 @@
+"""
+Throughput and correctness benchmark for N2gk / N2gkPlus.
+
+Checks every sentence of the golden corpus against its recorded N2gk and
+N2gkPlus outputs, then measures sentences/sec and per-stage cost on a
+synthetic corpus. Runs offline on CPU; exits with status 1 when any
+normalized output differs from the golden results.
+
+    python src/benchmark/normalization_benchmark.py --num_synthetic 20000
+"""
+import argparse
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from module.data_conditioning.normalization import N2gk, N2gkPlus, StageTrace
+
+GOLDEN_JSONL = Path(__file__).resolve().parent / "data" / "n2gk_golden.jsonl"
+
+
+# ─── Synthetic corpus ─────────────────────────────────────────────────────────
+SYNTHETIC_TEMPLATES = [
+    "사과 {n}개와 배 {n}개를 샀다.",
+    "총 {big}원을 송금했다.",
+    "{year}년 {month}월 {day}일에 {n}명이 참석했다.",
+    "무게는 {f}kg, 길이는 {n}cm이다.",
+    "{n}~{n2}km 구간에서 {n}분 걸렸다.",
+    "문의는 010-{d4}-{d4}로 연락주세요.",
+    "{hist} 이후 {n}년이 지났다.",
+    "매출이 {n}% 증가했고 RAM {n}GB 제품이 팔렸다.",
+    "NASA와 FIFA, KIA가 {n}위를 차지했다.",
+    "(참고) 온도는 {f}℃, 습도는 {n}%입니다.",
+    "코로나19 확산으로 {n}시 {n2}분에 회의가 열렸다.",
+    "ㄱㄴㄷ 순서로 「{n}번」 항목을 확인했다.",
+]
+
+HISTORY_EVENTS = ["4.19 혁명", "5.18 민주화 운동", "3.1 운동", "6.25 전쟁", "12.12 군사 반란"]
+
+
+def generate_synthetic(num_sentences: int, seed: int = 74) -> list[str]:
+    """
+    Generates a reproducible list of sentences mixing numbers, units, ranges,
+    phone numbers, dotted history dates, abbreviations and symbols.
+    """
+    rng = random.Random(seed)
+    sentences = []
+    for _ in range(num_sentences):
+        template = rng.choice(SYNTHETIC_TEMPLATES)
+        sentences.append(template.format(
+            n=rng.randint(1, 99),
+            n2=rng.randint(100, 999),
+            big=f"{rng.randint(1, 99_999_999):,}",
+            year=rng.randint(1900, 2030),
+            month=rng.randint(1, 12),
+            day=rng.randint(1, 28),
+            f=f"{rng.randint(0, 99)}.{rng.randint(1, 9)}",
+            d4=f"{rng.randint(0, 9999):04d}",
+            hist=rng.choice(HISTORY_EVENTS),
+        ))
+    return sentences
+
+
+# ─── Golden corpus ────────────────────────────────────────────────────────────
+def load_golden(path: Path) -> list[dict]:
+    with path.open("r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def update_golden(path: Path, normalizers: dict) -> None:
+    """
+    Rewrites the expected outputs of the golden corpus with the current implementation.
+    Only use this after reviewing an intended behavior change.
+    """
+    records = load_golden(path)
+    with path.open("w", encoding="utf-8") as f:
+        for rec in records:
+            for name, normalizer in normalizers.items():
+                rec[name] = normalizer(rec["text"])
+            json.dump(rec, f, ensure_ascii=False)
+            f.write("\n")
+    print(f"Golden corpus updated: {path} ({len(records)} sentences)")
+
+
+def check_golden(records: list[dict], normalizers: dict) -> list[dict]:
+    """
+    Returns one entry per (sentence, normalizer) whose output differs from the golden result.
+    Entries whose expected output is a pinned bug (rec["known_issue"][normalizer]) carry its
+    description, so fixing that bug can be told apart from a regression.
+    """
+    mismatches = []
+    for rec in records:
+        for name, normalizer in normalizers.items():
+            got = normalizer(rec["text"])
+            if got != rec[name]:
+                mismatches.append({
+                    "category": rec.get("category", ""),
+                    "normalizer": name,
+                    "text": rec["text"],
+                    "expected": rec[name],
+                    "got": got,
+                    "known_issue": rec.get("known_issue", {}).get(name),
+                })
+    return mismatches
+
+
+# ─── Timing ───────────────────────────────────────────────────────────────────
+def measure_throughput(normalizer, sentences: list[str], repeat: int = 3) -> float:
+    """
+    Returns the best sentences/sec over `repeat` runs of normalizer.__call__.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for s in sentences:
+            normalizer(s)
+        best = min(best, time.perf_counter() - start)
+    return len(sentences) / best if best > 0 else float("inf")
+
+
+def measure_stages(normalizer_cls, sentences: list[str], natural: bool = True) -> StageTrace:
+    """
+    Runs every sentence through a traced normalizer and returns the per-stage trace.
+    """
+    normalizer = normalizer_cls(natural=natural, trace=True)
+    for s in sentences:
+        normalizer(s)
+    return normalizer.trace
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="N2gk / N2gkPlus throughput and correctness benchmark")
+    parser.add_argument("--golden_jsonl", default=str(GOLDEN_JSONL), help="Golden corpus JSONL")
+    parser.add_argument("--num_synthetic", type=int, default=10000, help="Synthetic sentences for timing")
+    parser.add_argument("--seed", type=int, default=74, help="Seed of the synthetic generator")
+    parser.add_argument("--repeat", type=int, default=3, help="Timing repetitions (best is reported)")
+    parser.add_argument("--natural", action=argparse.BooleanOptionalAction, default=True)
+    parser.add_argument("--update_golden", action="store_true",
+                        help="Rewrite the golden outputs with the current implementation")
+    args = parser.parse_args()
+
+    normalizers = {"N2gk": N2gk(natural=args.natural), "N2gkPlus": N2gkPlus(natural=args.natural)}
+    golden_path = Path(args.golden_jsonl)
+
+    if args.update_golden:
+        update_golden(golden_path, normalizers)
+        return 0
+
+    # 1) Correctness against the golden corpus
+    records = load_golden(golden_path)
+    mismatches = check_golden(records, normalizers)
+    num_known = sum(len(rec.get("known_issue", {})) for rec in records)
+    print(f"[Golden] {len(records)} sentences x {len(normalizers)} normalizers, {len(mismatches)} mismatches "
+          f"({num_known} expected outputs are known issues)")
+    for m in mismatches:
+        print(f"  ({m['category']}/{m['normalizer']}) {m['text']!r}\n"
+              f"      expected: {m['expected']!r}\n"
+              f"      got     : {m['got']!r}")
+        if m["known_issue"]:
+            print(f"      known issue: {m['known_issue']} (the expected output is the bug; "
+                  f"refresh it and drop the known_issue entry if this is the fix)")
+
+    # 2) Throughput and per-stage cost on the synthetic corpus
+    sentences = generate_synthetic(args.num_synthetic, seed=args.seed)
+    for name, normalizer in normalizers.items():
+        sps = measure_throughput(normalizer, sentences, repeat=args.repeat)
+        print(f"\n[{name}] {sps:,.0f} sentences/sec ({len(sentences)} synthetic sentences)")
+        print(measure_stages(type(normalizer), sentences, natural=args.natural).report(name))
+
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
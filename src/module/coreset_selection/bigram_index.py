@@ -0,0 +1,136 @@
+import json
+from pathlib import Path
+import numpy as np
+from tqdm import tqdm
+
+from module.coreset_selection.sparse_jamobigram import SparseJamoBigram, load_memmap_arrays
+
+INDEX_FORMAT_VERSION = 1
+
+
+class JamoBigramIndex:
+    """
+    Inverted index of a JamoBigram-applied JSONL: for every bigram ID, the byte offsets of
+    the lines (records) that contain it, in file order, with the bigram's count in each.
+
+    Postings of bigram b are offsets[indptr[b]:indptr[b+1]] (and counts[...]). Arrays are
+    raw binary files in one directory with a meta.json, loaded as read-only memory maps, so
+    a query touches only the postings it reads and the matching JSONL lines.
+    """
+    ARRAY_DTYPES = {
+        "indptr": np.int64,
+        "offsets": np.int64,
+        "counts": np.int32,
+    }
+
+    def __init__(self, indptr: np.ndarray, offsets: np.ndarray, counts: np.ndarray, num_pair_ids: int,
+                 jsonl_path: str | None = None):
+        self.indptr = indptr
+        self.offsets = offsets
+        self.counts = counts
+        self.num_pair_ids = num_pair_ids
+        self.jsonl_path = jsonl_path
+
+    def num_records(self, bigram_id: int) -> int:
+        """
+        Number of records containing bigram_id.
+        """
+        return int(self.indptr[bigram_id + 1] - self.indptr[bigram_id])
+
+    def postings(self, bigram_id: int) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Returns (byte offsets of the records containing bigram_id, its count in each).
+        """
+        start, end = self.indptr[bigram_id], self.indptr[bigram_id + 1]
+        return self.offsets[start:end], self.counts[start:end]
+
+    def read_lines(self, bigram_id: int, jsonl_path: str | None = None, limit: int | None = None) -> list[bytes]:
+        """
+        Returns the JSONL lines (bytes, with newline) of the records containing bigram_id,
+        read by seeking to each one. jsonl_path defaults to the file the index was built for.
+        """
+        offsets, _ = self.postings(bigram_id)
+        if limit is not None:
+            offsets = offsets[:limit]
+        with Path(jsonl_path or self.jsonl_path).open("rb") as f:
+            lines = []
+            for offset in offsets.tolist():
+                f.seek(offset)
+                lines.append(f.readline())
+        return lines
+
+    def read_records(self, bigram_id: int, jsonl_path: str | None = None, limit: int | None = None) -> list[dict]:
+        """
+        Same as read_lines, parsed as JSON records.
+        """
+        return [json.loads(line) for line in self.read_lines(bigram_id, jsonl_path, limit)]
+
+    @classmethod
+    def load(cls, index_dir: str) -> "JamoBigramIndex":
+        """
+        Memory-maps an index directory written by build_bigram_index.
+        """
+        meta, arrays = load_memmap_arrays(index_dir, cls.ARRAY_DTYPES, INDEX_FORMAT_VERSION,
+                                          "JamoBigram index")
+        return cls(num_pair_ids=meta["num_pair_ids"], jsonl_path=meta.get("jsonl_path"), **arrays)
+
+
+def build_bigram_index(sparse_dir: str, index_dir: str, batch_size: int = 65536) -> JamoBigramIndex:
+    """
+    Builds the JamoBigramIndex of a SparseJamoBigram sidecar (the transpose of its CSR rows)
+    with a two-pass counting sort over chunks of batch_size rows: the first pass counts the
+    records of every bigram, the second writes each chunk's postings into their slots of
+    the memory-mapped output, so memory does not grow with the number of records.
+    """
+    matrix = SparseJamoBigram.load(sparse_dir)
+    index_dir = Path(index_dir)
+    index_dir.mkdir(parents=True, exist_ok=True)
+    n = matrix.num_pair_ids
+    nnz = len(matrix.indices)
+
+    # 1) Postings per bigram
+    df = np.zeros(n, dtype=np.int64)
+    for start in range(0, nnz, batch_size * 64):
+        df += np.bincount(matrix.indices[start:start + batch_size * 64], minlength=n)[:n]
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(df, out=indptr[1:])
+    np.asarray(indptr).tofile(index_dir / "indptr.bin")
+
+    # 2) Scatter every chunk's (offset, count) into the next free slots of its bigrams
+    arrays = {}
+    for name in ("offsets", "counts"):
+        path = index_dir / f"{name}.bin"
+        dtype = JamoBigramIndex.ARRAY_DTYPES[name]
+        with path.open("wb") as f:
+            f.truncate(nnz * np.dtype(dtype).itemsize)
+        arrays[name] = np.memmap(path, dtype=dtype, mode="r+") if nnz else np.empty(0, dtype=dtype)
+    cursor = indptr[:-1].copy()
+    for start in tqdm(range(0, matrix.num_rows, batch_size), desc='Building JamoBigram index'):
+        end = min(start + batch_size, matrix.num_rows)
+        nnz_start, nnz_end = int(matrix.indptr[start]), int(matrix.indptr[end])
+        ids = np.asarray(matrix.indices[nnz_start:nnz_end], dtype=np.int64)
+        row_offsets = np.repeat(np.asarray(matrix.line_offsets[start:end]),
+                                np.diff(np.asarray(matrix.indptr[start:end + 1])))
+        # Stable sort keeps file order within each bigram
+        order = np.argsort(ids, kind="stable")
+        ids = ids[order]
+        group_start = np.r_[0, np.flatnonzero(ids[1:] != ids[:-1]) + 1] if len(ids) else np.empty(0, dtype=np.int64)
+        rank = np.arange(len(ids)) - np.repeat(group_start, np.diff(np.r_[group_start, len(ids)]))
+        slots = cursor[ids] + rank
+        arrays["offsets"][slots] = row_offsets[order]
+        arrays["counts"][slots] = np.asarray(matrix.data[nnz_start:nnz_end])[order]
+        cursor += np.bincount(ids, minlength=n)
+    for array in arrays.values():
+        if isinstance(array, np.memmap):
+            array.flush()
+    del arrays
+
+    meta = {
+        "format_version": INDEX_FORMAT_VERSION,
+        "num_pair_ids": n,
+        "num_postings": nnz,
+        "jsonl_path": matrix.jsonl_path,
+    }
+    (index_dir / "meta.json").write_text(json.dumps(meta, indent=2), encoding="utf-8")
+    print(f"JamoBigram index saved to: {index_dir} ({nnz} postings)")
+    return JamoBigramIndex.load(str(index_dir))
@@ -1,13 +1,66 @@
+import hashlib
 import json
 import csv
 import math
+import os
 import random
 import re
+import collections
 import concurrent.futures
+import copy
 from pathlib import Path
+import numpy as np
 from tqdm import tqdm
 
-from module.coreset_selection.utils import convert_char_to_jamo, calculate_utmos_threshold
+from module.coreset_selection.utils import (
+    calculate_utmos_threshold,
+    calculate_utmos_threshold_from_scores,
+    counter_uniform,
+    calculate_grouped_utmos_thresholds,
+    file_content_hash,
+    stable_record_key,
+    utmos_group_key,
+    GroupedUtmosEstimator,
+    StreamingUtmosEstimator,
+)
+from module.coreset_selection.sparse_jamobigram import SparseJamoBigram, SparseJamoBigramWriter
+from module.coreset_selection.bigram_index import build_bigram_index
+
+CHOSUNG_LIST = [
+    'ᄀ','ᄁ','ᄂ','ᄃ','ᄄ','ᄅ','ᄆ','ᄇ','ᄈ','ᄉ',
+    'ᄊ','ᄋ','ᄌ','ᄍ','ᄎ','ᄏ','ᄐ','ᄑ','ᄒ'
+]
+JOONGSUNG_LIST = [
+    'ᅡ','ᅢ','ᅣ','ᅤ','ᅥ','ᅦ','ᅧ','ᅨ','ᅩ','ᅪ',
+    'ᅫ','ᅬ','ᅭ','ᅮ','ᅯ','ᅰ','ᅱ','ᅲ','ᅳ','ᅴ','ᅵ',
+]
+JONGSUNG_LIST = [
+    'ᆨ','ᆩ','ᆪ','ᆫ','ᆬ','ᆭ','ᆮ','ᆯ','ᆰ','ᆱ',
+    'ᆲ','ᆴ','ᆵ','ᆶ','ᆷ','ᆸ','ᆹ','ᆺ','ᆻ','ᆼ',
+    'ᆽ','ᆾ','ᆿ','ᇀ','ᇁ','ᇂ','ㄸ'
+]
+
+# Integer jamo codes: position in CHOSUNG_LIST + JOONGSUNG_LIST + JONGSUNG_LIST.
+# Any other character is encoded as UNKNOWN_JAMO_CODE, which never forms a pair.
+JAMO_LIST = CHOSUNG_LIST + JOONGSUNG_LIST + JONGSUNG_LIST
+UNKNOWN_JAMO_CODE = len(JAMO_LIST)
+
+# Precomposed Hangul syllables (가-힣): ord(c) - 0xAC00 = (cho * 21 + jung) * 28 + jong
+HANGUL_BASE = 0xAC00
+NUM_HANGUL_SYLLABLES = 11172
+NUM_JUNGSEONG = 21
+NUM_JONGSEONG = 28  # including "no final consonant" at index 0
+
+# Jamo n-grams with n > 2 are feature-hashed into 2**hash_bits IDs (Fibonacci hashing)
+HASH_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+# Every ID has a dense int64 slot in total_jamo_pair_count and .npy tables (8 * 2**hash_bits
+# bytes, 128 MiB at 24 bits) and a bool per setting in sweep_selection, so the cap keeps them
+# bounded (and IDs well within the int32 indices of the SparseJamoBigram sidecar)
+MAX_HASH_BITS = 24
+
+# Binary count table (.npy): int64 [TABLE_MAGIC, lookup-table version, num_pair_ids, counts...]
+TABLE_MAGIC = int.from_bytes(b"JBCOUNT1", "little")
+TABLE_HEADER_SIZE = 3
 
 
 class JamoBigram:
@@ -24,6 +77,15 @@ class JamoBigram:
         utmos_dynamic_type: str = "mad",
         num_workers: int = 4,
         total_table_path: str | None = None, 
+        selection_engine: str = "loop",
+        seed: int | None = None,
+        random_stream: str = "sequential",
+        record_id_field: str = "wav",
+        utmos_estimator: str = "exact",
+        utmos_group_field: str | None = None,
+        utmos_min_group_size: int = 50,
+        ngram: int = 2,
+        hash_bits: int = 20,
     ):
         
         self.t = t
@@ -33,34 +95,69 @@ class JamoBigram:
         self.utmos_dynamic_type = utmos_dynamic_type
         self.num_workers = num_workers
         self.total_table_path = total_table_path
+        # "loop"      : per-bigram draws from the global random module (filter_samples)
+        # "vectorized": keep_probabilities + one seeded draw per sample (selection_mask);
+        #               same keep probabilities, different draws for a given random.seed
+        if selection_engine not in ("vectorized", "loop"):
+            raise ValueError("Invalid selection_engine: choose 'vectorized' or 'loop'")
+        self.selection_engine = selection_engine
+        # "sequential": draws come from one generator in record order: self.rng for the
+        #               vectorized engine; for the loop engine random.Random(seed) (self.loop_rng),
+        #               or the global random module when no seed is given
+        # "counter"   : each sample's draws come from counter_uniform keyed on (seed, record key),
+        #               so sharded or reordered selection gives bit-identical results
+        if random_stream not in ("sequential", "counter"):
+            raise ValueError("Invalid random_stream: choose 'sequential' or 'counter'")
+        if random_stream == "counter" and seed is None:
+            raise ValueError("random_stream='counter' requires a seed")
+        self.random_stream = random_stream
+        self.seed = seed
+        self.rng = np.random.default_rng(seed)
+        self.loop_rng = random.Random(seed) if seed is not None else random
+        # Record field hashed by stable_record_key to identify a record independently of its position
+        self.record_id_field = record_id_field
+        # "exact"  : thresholds from all UTMOS scores kept in memory (grows with the record count)
+        # "tdigest": one-pass, fixed-memory StreamingUtmosEstimator (approximate quantile/MAD)
+        if utmos_estimator not in ("exact", "tdigest"):
+            raise ValueError("Invalid utmos_estimator: choose 'exact' or 'tdigest'")
+        self.utmos_estimator = utmos_estimator
+        # Grouped thresholds: records are thresholded by the streaming threshold of their
+        # record[utmos_group_field] group (e.g. "dataset", "speaker"); records of missing or
+        # smaller-than-utmos_min_group_size groups use the overall threshold (self.utmos_threshold)
+        self.utmos_group_field = utmos_group_field
+        self.utmos_min_group_size = utmos_min_group_size
+        self.group_utmos_thresholds: dict[str, float] = {}
+        # UTMOS statistics of the records seen by apply_jamobigram, gathered in the same pass
+        self.utmos_stats = StreamingUtmosEstimator()
 
        
         self.lookup_table = self.create_pair_lookup()
-        max_index = max(self.lookup_table.values())
-        self.total_jamo_pair_count = {i: 0 for i in range(max_index + 1)}
+        self.jamo_code_by_ord, self.pair_index_table = self.create_pair_index_table()
+        self.jong_code_by_index = self.create_jong_code_by_index()
+        # ngram = 2: the bigram IDs of lookup_table, in the 'JamoBigram' field.
+        # ngram > 2: IDs of hashed jamo n-grams in [0, 2**hash_bits), in a 'Jamo{n}gram' field
+        #            (see ngram_ids_from_codes); counting, tables, sidecars and selection are the same.
+        #            The count table takes 8 * 2**hash_bits bytes (8 MiB at the default 20 bits).
+        if not 2 <= ngram <= 10:
+            raise ValueError("ngram must be between 2 and 10")
+        if not 1 <= hash_bits <= MAX_HASH_BITS:
+            raise ValueError(f"hash_bits must be between 1 and {MAX_HASH_BITS}")
+        self.ngram = ngram
+        self.hash_bits = hash_bits
+        self.feature_field = ngram_field(ngram)
+        self.num_pair_ids = max(self.lookup_table.values()) + 1 if ngram == 2 else 1 << hash_bits
+        self.lookup_table_version = self.compute_lookup_table_version()
+        # Global counts indexed by bigram ID; may be a read-only memory map after load_total_table
+        self.total_jamo_pair_count = np.zeros(self.num_pair_ids, dtype=np.int64)
 
        
         if csv_total_table:
-            print("Loading Pre-defined CSV table\n")
-            self.load_total_csv_table(csv_total_table)
+            print("Loading Pre-defined count table\n")
+            self.load_total_table(csv_total_table)
 
         
 
     def create_pair_lookup(self):
-        CHOSUNG_LIST = [
-            'ᄀ','ᄁ','ᄂ','ᄃ','ᄄ','ᄅ','ᄆ','ᄇ','ᄈ','ᄉ',
-            'ᄊ','ᄋ','ᄌ','ᄍ','ᄎ','ᄏ','ᄐ','ᄑ','ᄒ'
-        ]
-        JOONGSUNG_LIST = [
-            'ᅡ','ᅢ','ᅣ','ᅤ','ᅥ','ᅦ','ᅧ','ᅨ','ᅩ','ᅪ',
-            'ᅫ','ᅬ','ᅭ','ᅮ','ᅯ','ᅰ','ᅱ','ᅲ','ᅳ','ᅴ','ᅵ',
-        ]
-        JONGSUNG_LIST = [
-            'ᆨ','ᆩ','ᆪ','ᆫ','ᆬ','ᆭ','ᆮ','ᆯ','ᆰ','ᆱ',
-            'ᆲ','ᆴ','ᆵ','ᆶ','ᆷ','ᆸ','ᆹ','ᆺ','ᆻ','ᆼ',
-            'ᆽ','ᆾ','ᆿ','ᇀ','ᇁ','ᇂ','ㄸ'
-        ]
-        
         lookup_table = {}
         idx = 0
         
@@ -89,60 +186,143 @@ class JamoBigram:
                 idx += 1
         return lookup_table
 
-    def _process_chunk(self, chunk):
+    def compute_lookup_table_version(self) -> int:
+        """
+        Returns a 63-bit hash of the lookup table, stored in binary count tables so that a
+        table built with a different jamo pair numbering is rejected on load.
+        """
+        text = json.dumps(sorted(self.lookup_table.items(), key=lambda kv: kv[1]), ensure_ascii=False)
+        if self.ngram > 2:
+            text += f"|ngram={self.ngram}|hash_bits={self.hash_bits}"
+        digest = hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest()
+        return int.from_bytes(digest, "little") >> 1
+
+    def create_pair_index_table(self):
         """
-        Processes a given chunk (list of jamos) using a sliding window approach 
-        and returns partial counts as a dictionary.
+        Integer-coded form of create_pair_lookup.
+        Returns (jamo_code_by_ord, pair_index_table):
+          - jamo_code_by_ord[ord(c)] is the jamo code of c (UNKNOWN_JAMO_CODE for non-jamo characters).
+          - pair_index_table[code1, code2] is the same bigram ID as lookup_table["'c1','c2'"], or -1.
         """
-        partial_counts = {}
-        n = len(chunk)
-        for i in range(n - 1):
-            token1 = chunk[i]
-            token2 = chunk[i+1]
-            key = f"'{token1}','{token2}'"
-            if key in self.lookup_table:
-                index = self.lookup_table[key]
-                partial_counts[index] = partial_counts.get(index, 0) + 1
-        return partial_counts
+        jamo_codes = {jamo: code for code, jamo in enumerate(JAMO_LIST)}
+        jamo_code_by_ord = np.full(max(map(ord, JAMO_LIST)) + 2, UNKNOWN_JAMO_CODE, dtype=np.int32)
+        for jamo, code in jamo_codes.items():
+            jamo_code_by_ord[ord(jamo)] = code
 
-    def count_lookup_pairs_parallel(self, flattened_jamo_list, num_workers=4):
+        pair_index_table = np.full((UNKNOWN_JAMO_CODE + 1, UNKNOWN_JAMO_CODE + 1), -1, dtype=np.int32)
+        for key, index in self.lookup_table.items():
+            token1, token2 = key[1:-1].split("','")
+            pair_index_table[jamo_codes[token1], jamo_codes[token2]] = index
+        return jamo_code_by_ord, pair_index_table
+
+    def create_jong_code_by_index(self) -> np.ndarray:
+        """
+        Maps a jongseong index (ord(c) - 0xAC00) % 28 to its jamo code.
+        Index 0 (no final consonant) maps to -1; finals missing from JONGSUNG_LIST
+        map to UNKNOWN_JAMO_CODE, exactly as their conjoining jamo would.
+        """
+        jong_code_by_index = np.empty(NUM_JONGSEONG, dtype=np.int32)
+        jong_code_by_index[0] = -1
+        for index in range(1, NUM_JONGSEONG):
+            jong_code_by_index[index] = self.jamo_code_by_ord[0x11A7 + index]
+        return jong_code_by_index
+
+    def encode_hangul(self, text: str) -> np.ndarray:
+        """
+        Decomposes the Hangul syllables (가-힣) of text into jamo codes arithmetically,
+        dropping every other character. Equivalent to encode_jamo on the jamos of
+        extract_korean(text), without going through convert_char_to_jamo.
+        """
+        syllables = np.frombuffer(text.encode('utf-32-le'), dtype=np.uint32).astype(np.int32) - HANGUL_BASE
+        syllables = syllables[(syllables >= 0) & (syllables < NUM_HANGUL_SYLLABLES)]
+        jong_index = syllables % NUM_JONGSEONG
+        codes = np.empty((len(syllables), 3), dtype=np.int32)
+        codes[:, 0] = syllables // (NUM_JUNGSEONG * NUM_JONGSEONG)
+        codes[:, 1] = len(CHOSUNG_LIST) + (syllables // NUM_JONGSEONG) % NUM_JUNGSEONG
+        codes[:, 2] = self.jong_code_by_index[jong_index]
+        keep = np.ones((len(syllables), 3), dtype=bool)
+        keep[:, 2] = jong_index != 0
+        # Row-major boolean indexing keeps the cho, jung[, jong] order of each syllable
+        return codes[keep]
+
+    def encode_jamo(self, jamo_list) -> np.ndarray:
+        """
+        Converts a sequence of jamo characters into an int32 array of jamo codes.
+        """
+        ords = np.fromiter(map(ord, jamo_list), dtype=np.int64, count=len(jamo_list))
+        # Characters beyond the table land on its last slot, which is UNKNOWN_JAMO_CODE
+        return self.jamo_code_by_ord[np.minimum(ords, len(self.jamo_code_by_ord) - 1)]
+
+    def pair_ids_from_codes(self, codes: np.ndarray) -> np.ndarray:
+        """
+        Returns the bigram IDs of every adjacent (codes[i], codes[i+1]) pair found in the lookup table.
+        """
+        if len(codes) < 2:
+            return np.empty(0, dtype=np.int32)
+        ids = self.pair_index_table[codes[:-1], codes[1:]]
+        return ids[ids >= 0]
+
+    def ngram_ids_from_codes(self, codes: np.ndarray) -> np.ndarray:
+        """
+        Returns the IDs of every jamo n-gram (n = self.ngram) of codes: the bigram IDs for
+        n = 2; otherwise every window of n codes whose adjacent pairs are all in the lookup
+        table, keyed as sum(codes[i+j] * 68**j) and hashed to hash_bits bits by multiplying
+        with HASH_MULTIPLIER (mod 2**64) and keeping the top bits. Memory is bounded by
+        2**hash_bits; distinct n-grams may share an ID once they approach that number.
+        """
+        if self.ngram == 2:
+            return self.pair_ids_from_codes(codes)
+        n = self.ngram
+        if len(codes) < n:
+            return np.empty(0, dtype=np.int64)
+        valid_pair = self.pair_index_table[codes[:-1], codes[1:]] >= 0
+        valid = np.lib.stride_tricks.sliding_window_view(valid_pair, n - 1).all(axis=1)
+        num_windows = len(codes) - n + 1
+        key = np.zeros(num_windows, dtype=np.uint64)
+        for j in range(n):
+            key += codes[j:j + num_windows].astype(np.uint64) * np.uint64((UNKNOWN_JAMO_CODE + 1) ** j)
+        hashed = (key[valid] * HASH_MULTIPLIER) >> np.uint64(64 - self.hash_bits)
+        return hashed.astype(np.int64)
+
+    def _count_pairs(self, flattened_jamo_list):
+        """
+        Counts every adjacent pair (n-gram) of the whole sequence with one vectorized table lookup.
+        Returns (IDs, counts) as arrays, without touching self.total_jamo_pair_count.
+        """
+        return np.unique(self.ngram_ids_from_codes(self.encode_jamo(flattened_jamo_list)), return_counts=True)
+
+    def count_lookup_pairs(self, flattened_jamo_list):
         """
         flattened_jamo_list: For example, a flat list of jamos like ['ᄋ','ᅡ','ㄴ','ㄴ','ᅧ','ㅇ'].
         
-        This method splits flattened_jamo_list into num_workers chunks (with one element overlap at chunk boundaries),
-        processes each chunk in parallel using _process_chunk, and sums the partial results from each chunk.
-        
-        It also cumulatively updates self.total_jamo_pair_count.
+        Counts the lookup pairs of the sequence and cumulatively updates self.total_jamo_pair_count.
         
         Returns: {index: total count for this text, ...}
         """
-        n = len(flattened_jamo_list)
-        if n < 2:
-            return {}
-        
-        # Chunk splitting: Add one element to the end of each chunk to preserve sliding window boundaries
-        chunk_size = n // num_workers
-        chunks = []
-        for i in range(num_workers):
-            start = i * chunk_size
-            # The last chunk goes up to n
-            end = (i+1)*chunk_size + 1 if i < num_workers - 1 else n
-            chunks.append(flattened_jamo_list[start:end])
-        
-        partial_counts_list = []
-        with concurrent.futures.ThreadPoolExecutor(max_workers=num_workers) as executor:
-            futures = [executor.submit(self._process_chunk, chunk) for chunk in chunks]
-            for future in concurrent.futures.as_completed(futures):
-                partial_counts_list.append(future.result())
-        
-        # Sum partial results and update cumulatively
-        final_counts = {}
-        for partial in partial_counts_list:
-            for index, cnt in partial.items():
-                final_counts[index] = final_counts.get(index, 0) + cnt
-                self.total_jamo_pair_count[index] += cnt
-        return final_counts
+        return self._accumulate_counts(*self._count_pairs(flattened_jamo_list))
+
+    def _accumulate_counts(self, ids, counts):
+        """
+        Adds one text's (IDs, counts) to self.total_jamo_pair_count and returns them as {index: count}.
+        """
+        self._ensure_writable_total()
+        # IDs are unique within one text, so fancy-index += does not drop repeats
+        self.total_jamo_pair_count[ids] += counts
+        return dict(zip(ids.tolist(), counts.tolist()))
 
+    def _add_to_total(self, partial_counts: np.ndarray) -> None:
+        """
+        Adds a dense array of partial counts (indexed by bigram ID) to self.total_jamo_pair_count.
+        """
+        self._ensure_writable_total()
+        self.total_jamo_pair_count += partial_counts
+
+    def _ensure_writable_total(self) -> None:
+        """
+        Copies a memory-mapped (read-only) total_jamo_pair_count before it is modified.
+        """
+        if not self.total_jamo_pair_count.flags.writeable:
+            self.total_jamo_pair_count = np.array(self.total_jamo_pair_count, dtype=np.int64)
 
     def extract_korean(self, text: str) -> str:
         """
@@ -150,48 +330,102 @@ class JamoBigram:
         """
         return re.sub(r'[^가-힣]', '', text)
 
+    def pair_ids_from_text(self, text: str) -> np.ndarray:
+        """
+        Returns the bigram (n-gram) IDs of the Hangul part of text, decomposed arithmetically by encode_hangul.
+        """
+        return self.ngram_ids_from_codes(self.encode_hangul(text))
+
+    def _count_pairs_from_text(self, text: str):
+        return np.unique(self.pair_ids_from_text(text), return_counts=True)
+
     def count_lookup_pairs_from_text(self, text):
         """
-        Takes plain text as input, generates a flattened list of jamos using the 
-        convert_char_to_jamo function, removes spaces (' '), and then calls the 
-        count_lookup_pairs_parallel method to return results in the format {index: count}.
+        Takes plain text as input, keeps only its Hangul syllables (as extract_korean does),
+        and returns the results in the format {index: count}, cumulatively updating
+        self.total_jamo_pair_count.
+        """
+        return self._accumulate_counts(*self._count_pairs_from_text(text))
+
+    def annotate_lines(self, lines):
+        """
+        Adds a 'JamoBigram' (feature_field) field to each JSONL line of a batch.
+        Returns (annotated lines as UTF-8 bytes ending in a newline,
+                 per-record rows for SparseJamoBigramWriter.append_batch);
+        self.total_jamo_pair_count is not modified. The batch's global counts are the
+        sparse rows["ids"] / rows["counts"], so a worker never returns a dense array.
         """
-        text_ko = self.extract_korean(text)
-        nested_jamo_list = convert_char_to_jamo(text_ko)
-        flattened_jamo_list = [char for sublist in nested_jamo_list for char in sublist if char != ' ']
-        return self.count_lookup_pairs_parallel(flattened_jamo_list)
+        out_lines = []
+        batch_ids, batch_counts = [], []
+        utmos, duration, record_key = [], [], []
+        for line in lines:
+            if not line.strip():
+                continue
+            data = json.loads(line)
+            ids, counts = self._count_pairs_from_text(data.get('N2gkPlus', ''))
+            data[self.feature_field] = {str(k): v for k, v in zip(ids.tolist(), counts.tolist())}
+            out_lines.append((json.dumps(data, ensure_ascii=False) + "\n").encode('utf-8'))
+            batch_ids.append(ids)
+            batch_counts.append(counts)
+            utmos.append(float(data['utmos']) if 'utmos' in data else np.nan)
+            duration.append(float(data.get('duration', 0)))
+            record_key.append(stable_record_key(data, self.record_id_field))
+        ids = np.concatenate(batch_ids) if batch_ids else np.empty(0, dtype=np.int64)
+        counts = np.concatenate(batch_counts) if batch_counts else np.empty(0, dtype=np.int64)
+        rows = {
+            'row_nnz': np.array([len(x) for x in batch_ids], dtype=np.int64),
+            'ids': ids,
+            'counts': counts,
+            'line_lengths': np.array([len(x) for x in out_lines], dtype=np.int64),
+            'utmos': np.array(utmos, dtype=np.float64),
+            'duration': np.array(duration, dtype=np.float64),
+            'record_key': np.array(record_key, dtype=np.uint64),
+        }
+        return out_lines, rows
 
    
-    def filter_instance(self, global_count, t=500, beta=0.0001,sample_utmos=0, utmos_threshold=None):
+    def filter_instance(self, global_count, t=500, beta=0.0001,sample_utmos=0, utmos_threshold=None, draw=None):
         """
         Calculates the probability of keeping the jamo for a given global_count.
           - Always True if global_count is less than or equal to t.
           - If greater than t, kept with a probability of p_keep = exp(-beta * (global_count - t)).
+        draw: uniform value in [0, 1) to compare against p_keep; self.loop_rng.random() if None.
         """
         if global_count <= t:
             return True
         else:
             p_keep = math.exp(-beta * (global_count - t))
+            if draw is None:
+                draw = self.loop_rng.random()
             if utmos_threshold is not None :
-                return (random.random() < p_keep) and (sample_utmos >= utmos_threshold)
+                return (draw < p_keep) and (sample_utmos >= utmos_threshold)
             else :
-                return random.random() < p_keep
+                return draw < p_keep
 
-    def should_keep_sample(self, sample_jamobigram, sample_utmos, t=500, beta=0.0001, utmos_threshold=None):
+    def should_keep_sample(self, sample_jamobigram, sample_utmos, t=500, beta=0.0001, utmos_threshold=None,
+                           record_key=None):
 
         """
         sample_jamobigram: The "JamoBigram" dictionary for the sample (key: jamo id, value: count).
         Uses self.total_jamo_pair_count for global counts.
         
         If the keep condition (filter_instance) is met for at least one jamo, the sample is kept (True).
+        With random_stream="counter", the j-th draw of the sample is counter_uniform(seed, record_key, j).
         """
+        draws = None
+        if self.random_stream == "counter":
+            n = len(sample_jamobigram)
+            draws = counter_uniform(self.seed, np.full(n, record_key, dtype=np.uint64), np.arange(n)).tolist()
         
-        for jamo_id, count in sample_jamobigram.items():
+        for j, (jamo_id, count) in enumerate(sample_jamobigram.items()):
 
 
-            global_count = self.total_jamo_pair_count.get(int(jamo_id), 0)
+            index = int(jamo_id)
+            global_count = (int(self.total_jamo_pair_count[index])
+                            if 0 <= index < self.num_pair_ids else 0)
             
-            if self.filter_instance(global_count, t, beta, sample_utmos, utmos_threshold):
+            if self.filter_instance(global_count, t, beta, sample_utmos, utmos_threshold,
+                                    draws[j] if draws is not None else None):
                 return True
         return False
 
@@ -201,27 +435,274 @@ class JamoBigram:
         
         Checks the JamoBigram information of each sample and returns only those samples 
         that satisfy the keep condition (should_keep_sample) based on self.total_jamo_pair_count.
+        utmos_threshold is a single threshold or a list with one per sample.
         """
+        if not isinstance(utmos_threshold, (list, np.ndarray)):
+            utmos_threshold = [utmos_threshold] * len(samples)
         filtered_samples = []
-        for sample in samples:
-            sample_jamobigram = sample.get("JamoBigram", {})
+        for sample, sample_threshold in zip(samples, utmos_threshold):
+            sample_jamobigram = sample.get(self.feature_field, {})
             sample_utmos = sample.get("utmos", 0)
+            record_key = (stable_record_key(sample, self.record_id_field)
+                          if self.random_stream == "counter" else None)
 
-            if self.should_keep_sample(sample_jamobigram, sample_utmos,t, beta,  utmos_threshold):
+            if self.should_keep_sample(sample_jamobigram, sample_utmos,t, beta,  sample_threshold, record_key):
                 filtered_samples.append(sample)
 
 
         return filtered_samples   
 
+    def global_count_array(self) -> np.ndarray:
+        """
+        Returns self.total_jamo_pair_count as a dense int64 array indexed by bigram ID.
+        """
+        return np.asarray(self.total_jamo_pair_count, dtype=np.int64)
+
+    def keep_probabilities(self, indptr, indices, utmos, t=500, beta=0.0001, utmos_threshold=None,
+                           global_counts=None) -> np.ndarray:
+        """
+        Vectorized form of should_keep_sample for samples given as CSR rows (indptr, indices)
+        with per-row UTMOS scores. Returns the probability that each sample is kept.
+
+        should_keep_sample draws once per bigram until one passes, so a sample is kept
+          - with probability 1 if any of its bigrams has global_count <= t,
+          - otherwise with probability 1 - prod(1 - p_keep) over its bigrams,
+            and only if its UTMOS is >= utmos_threshold (when given; a scalar or one per row),
+          - never if it has no bigram.
+        """
+        if global_counts is None:
+            global_counts = self.global_count_array()
+        indptr = np.asarray(indptr, dtype=np.int64)
+        p_keep, any_below = self._keep_terms(indptr, self._entry_global_counts(indices, global_counts), t, beta)
+        if utmos_threshold is not None:
+            p_keep = np.where(np.asarray(utmos) >= utmos_threshold, p_keep, 0.0)
+        return np.where(any_below, 1.0, p_keep)
+
+    @staticmethod
+    def _entry_global_counts(indices, global_counts) -> np.ndarray:
+        """
+        Global count of every CSR entry; bigram IDs outside the table have a global count of 0,
+        as with dict.get(..., 0).
+        """
+        indices = np.asarray(indices)
+        known = (indices >= 0) & (indices < len(global_counts))
+        return np.where(known, global_counts[np.where(known, indices, 0)], 0)
+
+    @staticmethod
+    def _keep_terms(indptr, global_count, t, beta) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Returns per row (1 - prod(1 - p_keep) over bigrams above t, whether any bigram is <= t).
+        """
+        below = global_count <= t
+        excess = beta * np.maximum(global_count - t, 0)
+        # log(1 - p_keep) with p_keep = exp(-excess), computed without cancellation
+        with np.errstate(divide='ignore'):
+            log_miss = np.where(below, 0.0, np.log(-np.expm1(-excess)))
+        return -np.expm1(segment_sum(log_miss, indptr)), segment_sum(below, indptr) > 0
+
+    def selection_mask(self, indptr, indices, utmos, t=500, beta=0.0001, utmos_threshold=None,
+                       record_keys=None) -> np.ndarray:
+        """
+        Decides keep/drop for every sample at once with one draw per sample, taken from self.rng
+        or, with random_stream="counter", from counter_uniform(seed, record_keys).
+        """
+        p_keep = self.keep_probabilities(indptr, indices, utmos, t, beta, utmos_threshold)
+        return self.draw_uniform(len(p_keep), record_keys) < p_keep
+
+    def draw_uniform(self, n: int, record_keys=None) -> np.ndarray:
+        """
+        One uniform draw per sample from the configured random stream.
+        """
+        if self.random_stream == "counter":
+            if record_keys is None:
+                raise ValueError("random_stream='counter' needs the record keys of the samples")
+            return counter_uniform(self.seed, record_keys)
+        return self.rng.random(n)
+
+    def sweep_selection(self, sparse_input: str, ts, betas, utmos_thresholds=None,
+                        batch_size: int = 65536) -> list[dict]:
+        """
+        Evaluates every (t, beta, utmos_threshold) of the grid on a SparseJamoBigram sidecar,
+        reading it once in chunks of batch_size rows, without writing any JSONL.
+
+        Each record gets one counter draw counter_uniform(seed, record_key), shared by all
+        settings, so the reported numbers are exactly what run_selection keeps with
+        random_stream="counter" and the same seed (see write_sweep_selection).
+        utmos_thresholds defaults to [self.utmos_threshold], or the threshold computed from the
+        sidecar's scores as in run_selection; None in the list disables UTMOS gating.
+
+        Returns one dict per setting with kept_records, kept_hours and coverage (distinct
+        bigrams in the kept records / distinct bigrams in the input).
+        """
+        if self.seed is None:
+            raise ValueError("sweep_selection requires a seed (records are decided with counter draws)")
+        matrix = SparseJamoBigram.load(sparse_input)
+        if matrix.num_pair_ids != self.num_pair_ids:
+            raise ValueError(f"Sidecar has {matrix.num_pair_ids} IDs, but this JamoBigram (ngram={self.ngram}) "
+                             f"has {self.num_pair_ids}")
+        if utmos_thresholds is None:
+            utmos_threshold = self.utmos_threshold
+            if utmos_threshold is None:
+                utmos_threshold = calculate_utmos_threshold_from_scores(
+                    matrix.utmos, mode=self.utmos_mode, dynamic_type=self.utmos_dynamic_type
+                )
+            utmos_thresholds = [utmos_threshold]
+        pairs = [(t, beta) for t in ts for beta in betas]
+        num_settings = len(pairs) * len(utmos_thresholds)
+        kept_records = np.zeros(num_settings, dtype=np.int64)
+        kept_seconds = np.zeros(num_settings, dtype=np.float64)
+        covered = np.zeros((num_settings, self.num_pair_ids), dtype=bool)
+        present = np.zeros(self.num_pair_ids, dtype=bool)
+        global_counts = self.global_count_array()
+
+        for start in tqdm(range(0, matrix.num_rows, batch_size), desc='Sweeping selection settings'):
+            end = min(start + batch_size, matrix.num_rows)
+            nnz_start, nnz_end = int(matrix.indptr[start]), int(matrix.indptr[end])
+            indptr = np.asarray(matrix.indptr[start:end + 1]) - nnz_start
+            indices = np.asarray(matrix.indices[nnz_start:nnz_end])
+            in_table = (indices >= 0) & (indices < self.num_pair_ids)
+            entry_row = np.repeat(np.arange(end - start), np.diff(indptr))
+            # Records without 'utmos' count as 0, as in filter_samples
+            utmos = np.nan_to_num(matrix.utmos[start:end], nan=0.0)
+            duration = np.asarray(matrix.duration[start:end])
+            draws = counter_uniform(self.seed, matrix.record_key[start:end])
+            entry_counts = self._entry_global_counts(indices, global_counts)
+            present[indices[in_table]] = True
+
+            for p, (t, beta) in enumerate(pairs):
+                p_keep, any_below = self._keep_terms(indptr, entry_counts, t, beta)
+                for u, utmos_threshold in enumerate(utmos_thresholds):
+                    setting = p * len(utmos_thresholds) + u
+                    p_setting = p_keep if utmos_threshold is None else np.where(utmos >= utmos_threshold, p_keep, 0.0)
+                    keep = draws < np.where(any_below, 1.0, p_setting)
+                    kept_records[setting] += int(keep.sum())
+                    kept_seconds[setting] += float(duration[keep].sum())
+                    covered[setting, indices[keep[entry_row] & in_table]] = True
+
+        num_present = max(int(present.sum()), 1)
+        results = []
+        print(f"{'t':>8} {'beta':>10} {'utmos_thr':>10} {'records':>10} {'hours':>10} {'coverage':>9}")
+        for p, (t, beta) in enumerate(pairs):
+            for u, utmos_threshold in enumerate(utmos_thresholds):
+                setting = p * len(utmos_thresholds) + u
+                result = {
+                    "t": t,
+                    "beta": beta,
+                    "utmos_threshold": utmos_threshold,
+                    "kept_records": int(kept_records[setting]),
+                    "kept_hours": float(kept_seconds[setting] / 3600),
+                    "coverage": float(covered[setting].sum() / num_present),
+                }
+                results.append(result)
+                thr = "-" if utmos_threshold is None else f"{utmos_threshold:.4f}"
+                print(f"{t:>8} {beta:>10.2e} {thr:>10} {result['kept_records']:>10} "
+                      f"{result['kept_hours']:>10.2f} {result['coverage']:>9.4f}")
+        print(f"Swept {num_settings} settings over {matrix.num_rows} records")
+        return results
+
+    def write_sweep_selection(self, setting: dict, input_jsonl: str, output_jsonl: str, sparse_input: str) -> None:
+        """
+        Writes the selection of one sweep_selection result: run_selection with its t, beta and
+        utmos_threshold and counter draws from the same seed. The selection runs on a copy,
+        so this object's parameters are left as they are.
+        """
+        selector = copy.copy(self)
+        selector.t, selector.beta = setting["t"], setting["beta"]
+        # No gating (None) is a threshold every score passes
+        selector.utmos_threshold = (setting["utmos_threshold"] if setting["utmos_threshold"] is not None
+                                    else float("-inf"))
+        selector.group_utmos_thresholds = {}
+        selector.random_stream = "counter"
+        selector.selection_engine = "vectorized"
+        selector.run_selection(input_jsonl, output_jsonl, sparse_input=sparse_input)
+
+    def samples_to_rows(self, samples):
+        """
+        Converts samples with a "JamoBigram" dictionary into CSR rows (indptr, indices),
+        a UTMOS array (missing 'utmos' counts as 0, as in filter_samples) and
+        their stable_record_key values.
+        """
+        row_ids = [np.fromiter(map(int, s.get(self.feature_field, {})), dtype=np.int64) for s in samples]
+        indptr = np.zeros(len(samples) + 1, dtype=np.int64)
+        np.cumsum([len(ids) for ids in row_ids], out=indptr[1:])
+        indices = np.concatenate(row_ids) if row_ids else np.empty(0, dtype=np.int64)
+        utmos = np.array([float(s.get("utmos", 0)) for s in samples], dtype=np.float64)
+        record_keys = np.array([stable_record_key(s, self.record_id_field) for s in samples], dtype=np.uint64)
+        return indptr, indices, utmos, record_keys
+
     def save_total_counts(self):
-        # Ensure parent directory exists for total_table_path
-        total_counts = self.total_jamo_pair_count
-        with open(self.total_table_path, "w", newline="", encoding="utf-8") as csvfile:
+        """
+        Saves self.total_jamo_pair_count to total_table_path: as a binary count table if the
+        path ends with .npy (see save_total_npy_table), otherwise as CSV.
+        """
+        if Path(self.total_table_path).suffix == ".npy":
+            self.save_total_npy_table(self.total_table_path)
+        else:
+            self.save_total_csv_table(self.total_table_path)
+        print(f"Total counts saved to: {self.total_table_path}")
+
+    def save_total_csv_table(self, csv_path: str) -> None:
+        """
+        Writes the global counts as CSV with a ("Jamo_Pair", "Count") header; also usable to
+        export a binary table for inspection.
+        """
+        with open(csv_path, "w", newline="", encoding="utf-8") as csvfile:
             writer = csv.writer(csvfile)
             writer.writerow(["Jamo_Pair", "Count"])
-            for index, count in total_counts.items():
+            counts = self.global_count_array()
+            # Hashed n-gram tables have 2**hash_bits IDs, mostly empty: only non-zero IDs are listed
+            indices = np.arange(len(counts)) if self.ngram == 2 else np.flatnonzero(counts)
+            for index, count in zip(indices.tolist(), counts[indices].tolist()):
                 writer.writerow([index, count])
-        print(f"Total counts saved to CSV at: {self.total_table_path}")
+
+    def save_total_npy_table(self, npy_path: str) -> None:
+        """
+        Writes the global counts as one fixed-length int64 .npy array:
+        [TABLE_MAGIC, lookup_table_version, num_pair_ids, count of ID 0, ..., count of ID n-1].
+        """
+        header = np.array([TABLE_MAGIC, self.lookup_table_version, self.num_pair_ids], dtype=np.int64)
+        table = np.concatenate([header, self.global_count_array()])
+        # Written to a temporary file and renamed, since npy_path may be memory-mapped right now
+        tmp_path = Path(npy_path).with_name(Path(npy_path).name + ".tmp")
+        with tmp_path.open("wb") as f:
+            np.save(f, table)
+        os.replace(tmp_path, npy_path)
+
+    def read_total_table(self, table_path: str) -> np.ndarray:
+        """
+        Reads a count table (.npy binary or CSV, by suffix) and returns its counts as an int64
+        array indexed by bigram ID. Binary tables are returned as a read-only memory map.
+        """
+        table_file = Path(table_path)
+        if table_file.suffix == ".npy":
+            table = np.load(table_file, mmap_mode="r")
+            if (table.dtype != np.int64 or len(table) < TABLE_HEADER_SIZE
+                    or int(table[0]) != TABLE_MAGIC):
+                raise ValueError(f"Not a JamoBigram count table: {table_file}")
+            if int(table[1]) != self.lookup_table_version or int(table[2]) != self.num_pair_ids:
+                raise ValueError(f"Count table {table_file} was built with a different jamo pair lookup table")
+            return table[TABLE_HEADER_SIZE:]
+
+        counts = np.zeros(self.num_pair_ids, dtype=np.int64)
+        with table_file.open("r", newline="", encoding="utf-8") as csvfile:
+            for row in csv.DictReader(csvfile):
+                index = int(row["Jamo_Pair"])
+                if not 0 <= index < self.num_pair_ids:
+                    raise ValueError(f"Unknown Jamo_Pair {index} in {table_file}")
+                counts[index] = int(row["Count"])
+        return counts
+
+    def load_total_table(self, table_path: str):
+        """
+        Replaces self.total_jamo_pair_count with the counts of a local .npy or CSV table.
+        A .npy table is memory-mapped, so loading does not parse or copy it.
+        """
+        table_file = Path(table_path)
+        if not table_file.exists():
+            print(f"Count table not found at: {table_file}")
+            return
+        self.total_jamo_pair_count = self.read_total_table(table_file)
+        print(f"Total jamo pair count loaded from: {table_file}")
 
     def load_total_csv_table(self, csv_path: str):
         """
@@ -231,90 +712,420 @@ class JamoBigram:
         Args:
             csv_path (str): Full path to the CSV file (including directory and filename).
         """
-        csv_file = Path(csv_path)
-        if not csv_file.exists():
-            print(f"CSV file not found at: {csv_file}")
-            return
-        with csv_file.open("r", newline="", encoding="utf-8") as csvfile:
-            reader = csv.DictReader(csvfile)
-            # Read each row of the CSV, convert index and count to int, and assign to self.total_jamo_pair_count
-            self.total_jamo_pair_count = {int(row["Jamo_Pair"]): int(row["Count"]) for row in reader}
-        print(f"Total jamo pair count loaded from CSV at: {csv_file}")
+        self.load_total_table(csv_path)
 
-    def apply_jamobigram(self, input_jsonl: str, output_jsonl: str) -> None:
+    def merge_total_tables(self, table_paths, sources=None) -> list[dict]:
         """
-        For each record in the input JSONL, adds a 'JamoBigram' field, 
+        Adds partial count tables (one per dataset or shard, as written by save_total_counts)
+        to self.total_jamo_pair_count. Summing the partial tables gives exactly the counts of
+        the concatenated inputs, so the global table can be built without recounting.
+
+        sources optionally gives the (name, input JSONL) counted into each table, in the same
+        order; otherwise a table is recorded under its own stem and file. Returns one sources
+        manifest entry per table, to be written with save_sources once the table is saved, so
+        apply_jamobigram_incremental can later add datasets to the merged table.
+        """
+        table_paths = [Path(p) for p in table_paths]
+        if sources is None:
+            sources = [(p.stem, p) for p in table_paths]
+        if len(sources) != len(table_paths):
+            raise ValueError(f"{len(table_paths)} tables but {len(sources)} sources")
+        entries = []
+        for table_path, (source_name, source_path) in zip(table_paths, sources):
+            partial = self.read_total_table(table_path)
+            self._add_to_total(partial)
+            entries.append({
+                "name": source_name,
+                "path": str(source_path),
+                "content_hash": file_content_hash(source_path),
+                "pair_count": int(partial.sum()),
+            })
+            print(f"Merged partial jamo pair counts from: {table_path}")
+        return entries
+
+    def apply_jamobigram(
+        self,
+        input_jsonl: str,
+        output_jsonl: str,
+        batch_size: int = 1024,
+        sparse_output: str | None = None,
+        index_output: str | None = None,
+    ) -> None:
+        """
+        For each record in the input JSONL, adds a 'JamoBigram' (feature_field) field, 
         cumulatively updates total_jamo_pair_count, and saves an intermediate JSONL 
         (calls save_total_counts if needed).
+
+        Records are processed in batches of batch_size lines; with num_workers > 1 the batches
+        are annotated in a process pool and their sparse (ID, count) rows are summed here.
+        If sparse_output is given, the per-record vectors are also written there as a
+        SparseJamoBigram sidecar whose rows are aligned with the lines of output_jsonl.
+        The UTMOS scores are summarized in self.utmos_stats during the same pass
+        (e.g. self.utmos_stats.threshold(dynamic_type="mad")).
+        If index_output is also given, a JamoBigramIndex (bigram ID → byte offsets of the
+        records of output_jsonl) is built there from the sidecar.
         """
+        if index_output and not sparse_output:
+            raise ValueError("index_output requires sparse_output")
         inp = Path(input_jsonl)
         out = Path(output_jsonl)
-        records = []
-        with inp.open('r', encoding='utf-8') as f:
-            for line in tqdm(f, desc='Applying JamoBigram'):
-                data = json.loads(line)
-                counts = self.count_lookup_pairs_from_text(data.get('N2gkPlus', ''))
-                data['JamoBigram'] = {str(k): v for k, v in counts.items()}
-                records.append(data)
-        with out.open('w', encoding='utf-8') as f:
-            for rec in records:
-                json.dump(rec, f, ensure_ascii=False)
-                f.write("\n")
+        sparse_writer = (SparseJamoBigramWriter(sparse_output, self.num_pair_ids, str(out), self.record_id_field)
+                         if sparse_output else None)
+        with inp.open('r', encoding='utf-8') as f, out.open('wb') as outf, \
+                tqdm(desc='Applying JamoBigram') as pbar:
+            batches = iter_line_batches(f, batch_size)
+            if self.num_workers > 1:
+                with concurrent.futures.ProcessPoolExecutor(
+                    max_workers=self.num_workers, initializer=_init_jamobigram_worker,
+                    initargs=(self.record_id_field, self.ngram, self.hash_bits)
+                ) as executor:
+                    self._write_annotated(
+                        imap_ordered(executor, _annotate_lines_in_worker, batches, self.num_workers * 2),
+                        outf, pbar, sparse_writer
+                    )
+            else:
+                self._write_annotated(map(self.annotate_lines, batches), outf, pbar, sparse_writer)
+        if sparse_writer is not None:
+            sparse_writer.close()
+            print(f"Sparse JamoBigram sidecar saved to: {sparse_output}")
+        if index_output:
+            build_bigram_index(sparse_output, index_output)
         # Save total counts to CSV
         if self.total_table_path:
             self.save_total_counts()
 
-    def run_selection(self, input_jsonl: str, output_jsonl: str) -> None:
+    def _write_annotated(self, results, outf, pbar, sparse_writer=None) -> None:
+        for out_lines, rows in results:
+            outf.writelines(out_lines)
+            self._ensure_writable_total()
+            # IDs repeat across the records of a batch, so they are added with np.add.at
+            np.add.at(self.total_jamo_pair_count, rows["ids"], rows["counts"])
+            self.utmos_stats.update(rows["utmos"])
+            if sparse_writer is not None:
+                sparse_writer.append_batch(**rows)
+            pbar.update(len(out_lines))
+
+    def sources_path(self) -> Path:
+        """
+        Returns the manifest listing the datasets already counted into total_table_path
+        (e.g. total_jamo_counts.csv → total_jamo_counts.sources.json).
+        """
+        table = Path(self.total_table_path)
+        return table.with_name(f"{table.stem}.sources.json")
+
+    def load_sources(self) -> dict:
+        """
+        Reads the sources manifest of total_table_path (written by save_sources), or returns
+        an empty one if the table does not exist yet.
+        """
+        path = self.sources_path()
+        if not path.exists():
+            return {"total_count": 0, "sources": []}
+        return json.loads(path.read_text(encoding="utf-8"))
+
+    def save_sources(self, sources: list[dict]) -> None:
+        """
+        Writes the sources manifest of total_table_path: the datasets counted into the table
+        and its current total count, which apply_jamobigram_incremental checks on load.
+        """
+        manifest = {"total_count": int(self.total_jamo_pair_count.sum()), "sources": sources}
+        self.sources_path().write_text(json.dumps(manifest, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    def has_source(self, source_name: str) -> bool:
+        return any(src["name"] == source_name for src in self.load_sources()["sources"])
+
+    def apply_jamobigram_incremental(
+        self,
+        input_jsonl: str,
+        output_jsonl: str,
+        source_name: str | None = None,
+        batch_size: int = 1024,
+        sparse_output: str | None = None,
+        index_output: str | None = None,
+    ) -> None:
+        """
+        Adds one new dataset to the existing table at total_table_path: loads the table,
+        runs apply_jamobigram on input_jsonl only (so the cost is proportional to the new
+        data), saves the table and records the dataset in the sources manifest.
+        sparse_output and index_output are passed to apply_jamobigram.
+
+        A dataset whose name (default: the input file stem) or content hash is already in
+        the manifest is refused, so the same data cannot be counted twice. The manifest
+        also stores the table's total count, which is checked on load to detect a table
+        that was modified or rebuilt without it.
+        """
+        if not self.total_table_path:
+            raise ValueError("apply_jamobigram_incremental requires total_table_path")
+        inp = Path(input_jsonl)
+        source_name = source_name or inp.stem
+        manifest = self.load_sources()
+        content_hash = file_content_hash(inp)
+        for src in manifest["sources"]:
+            if src["name"] == source_name or src["content_hash"] == content_hash:
+                raise ValueError(f"Source already counted into {self.total_table_path}: "
+                                 f"{src['name']} ({src['path']})")
+
+        self.total_jamo_pair_count = np.zeros(self.num_pair_ids, dtype=np.int64)
+        if Path(self.total_table_path).exists():
+            self.load_total_table(self.total_table_path)
+        loaded_total = int(self.total_jamo_pair_count.sum())
+        if loaded_total != manifest["total_count"]:
+            raise ValueError(f"{self.total_table_path} holds {loaded_total} pairs but its sources manifest "
+                             f"records {manifest['total_count']}; rebuild the table")
+
+        self.apply_jamobigram(str(inp), output_jsonl, batch_size=batch_size,
+                              sparse_output=sparse_output, index_output=index_output)
+
+        total = int(self.total_jamo_pair_count.sum())
+        manifest["sources"].append({
+            "name": source_name,
+            "path": str(inp),
+            "content_hash": content_hash,
+            "pair_count": total - loaded_total,
+        })
+        self.save_sources(manifest["sources"])
+        print(f"Added source '{source_name}' to {self.total_table_path} ({total - loaded_total} pairs)")
+
+    def run_selection(self, input_jsonl: str, output_jsonl: str, sparse_input: str | None = None,
+                      batch_size: int = 8192) -> None:
         """
         Performs filtering only on a JSONL file where JamoBigram has already been applied, 
         and saves the result.
+
+        The input is streamed in batches of batch_size records and kept records are written as
+        each batch is decided, so the selection itself does not hold the records. The UTMOS
+        threshold comes from a prior pass over the scores when it is not given. Draws are taken
+        in record order, so the output does not depend on batch_size.
+
+        Peak memory is constant only with utmos_estimator="tdigest" (or a given utmos_threshold):
+        the default "exact" estimator keeps every UTMOS score of the threshold pass (8 bytes per
+        record), and grouped thresholds over a sidecar keep a group code per record (4 bytes).
+
+        If sparse_input points to the SparseJamoBigram sidecar written by apply_jamobigram for
+        input_jsonl, the JamoBigram vectors and UTMOS scores are read from it instead of
+        parsing the JSONL, and kept lines are copied from input_jsonl as they are.
+
+        With utmos_group_field, one threshold per group is computed in a single scan (streaming
+        statistics per group) and each record is compared with its group's threshold.
         """
         inp = Path(input_jsonl)
         out = Path(output_jsonl)
+        if sparse_input:
+            self._run_selection_sparse(inp, out, SparseJamoBigram.load(sparse_input), batch_size)
+            return
         # 1) Calculate UTMOS threshold
-        if self.utmos_threshold is None:
+        if self.utmos_threshold is None and self.utmos_group_field:
+            self.group_utmos_thresholds, self.utmos_threshold = calculate_grouped_utmos_thresholds(
+                inp,
+                self.utmos_group_field,
+                self.utmos_min_group_size,
+                mode=self.utmos_mode,
+                dynamic_type=self.utmos_dynamic_type
+            )
+            print(f"[UTMOS threshold] = {self.utmos_threshold:.4f} (overall)")
+        elif self.utmos_threshold is None:
             self.utmos_threshold = calculate_utmos_threshold(
                 jsonl_path=inp,
                 mode=self.utmos_mode,
-                dynamic_type=self.utmos_dynamic_type
+                dynamic_type=self.utmos_dynamic_type,
+                estimator=self.utmos_estimator
             )
             print(f"[UTMOS threshold] = {self.utmos_threshold:.4f}")
 
-        """
-        filtered = []
-        for s in tqdm(samples, desc='Filtering JamoBigram samples'):
-            if self.should_keep_sample(
-                {int(k): v for k,v in s.get('JamoBigram', {}).items()},
-                s.get('utmos', 0),
-                t=self.t,
-                beta=self.beta,
-                utmos_threshold=self.utmos_threshold
-            ):
-                filtered.append(s)
-        print(f"Filtered {len(filtered)} / {len(samples)} samples")
-        """
-        samples = []
-        # Read all samples from the input JSONL file
-        with inp.open("r", encoding="utf-8") as infile:
-            for line in infile:
-                line = line.strip()
-                if not line:
-                    continue
-                try:
-                    sample = json.loads(line)
-                    samples.append(sample)
-                except json.JSONDecodeError as e:
-                    print(f"Error decoding line: {line}\n{e}")
-        
-        # Filter samples based on the BalJamo object's total_jamo_pair_count
+        # 2) Filter batch by batch based on the JamoBigram object's total_jamo_pair_count
         print(f't : {self.t}, beta : {self.beta}')
-        filtered_samples = self.filter_samples(samples, self.t, self.beta, self.utmos_threshold)
-        print(f"Filtered {len(filtered_samples)} / {len(samples)} samples")
+        out.parent.mkdir(parents=True, exist_ok=True)
+        num_samples = num_kept = 0
+        with inp.open("r", encoding="utf-8") as infile, out.open('w', encoding='utf-8') as f, \
+                tqdm(desc='Filtering JamoBigram samples') as pbar:
+            for lines in iter_line_batches(infile, batch_size):
+                samples = []
+                for line in lines:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        samples.append(json.loads(line))
+                    except json.JSONDecodeError as e:
+                        print(f"Error decoding line: {line}\n{e}")
+                for sample in self._select_batch(samples):
+                    json.dump(sample, f, ensure_ascii=False)
+                    f.write("\n")
+                    num_kept += 1
+                num_samples += len(samples)
+                pbar.update(len(lines))
+        print(f"Filtered {num_kept} / {num_samples} samples")
+        print(f"Selection output saved to: {out}")
+
+    def _select_batch(self, samples):
+        """
+        Returns the kept samples of one batch with the configured selection engine.
+        """
+        thresholds = self.utmos_threshold
+        if self.group_utmos_thresholds:
+            thresholds = np.array([
+                self.group_utmos_thresholds.get(utmos_group_key(s, self.utmos_group_field), self.utmos_threshold)
+                for s in samples
+            ], dtype=np.float64)
+        if self.selection_engine == "vectorized":
+            indptr, indices, utmos, record_keys = self.samples_to_rows(samples)
+            mask = self.selection_mask(indptr, indices, utmos, self.t, self.beta, thresholds, record_keys)
+            return [s for s, keep in zip(samples, mask) if keep]
+        return self.filter_samples(samples, self.t, self.beta, thresholds)
 
-        # 4) Save
+    def _run_selection_sparse(self, inp: Path, out: Path, matrix: SparseJamoBigram, batch_size: int = 8192) -> None:
+        matrix.check_jsonl(inp)
+        if matrix.num_pair_ids != self.num_pair_ids:
+            raise ValueError(f"Sidecar has {matrix.num_pair_ids} IDs, but this JamoBigram (ngram={self.ngram}) "
+                             f"has {self.num_pair_ids}")
+        if self.random_stream == "counter" and matrix.record_id_field != self.record_id_field:
+            raise ValueError(
+                f"Sidecar record keys were built from '{matrix.record_id_field}', "
+                f"but record_id_field is '{self.record_id_field}'"
+            )
+        group_codes = group_table = None
+        if self.utmos_threshold is None and self.utmos_group_field:
+            group_codes, group_table = self._sparse_group_thresholds(inp, matrix, batch_size)
+        elif self.utmos_threshold is None and self.utmos_estimator == "tdigest":
+            stats = StreamingUtmosEstimator()
+            for start in range(0, matrix.num_rows, batch_size):
+                stats.update(matrix.utmos[start:start + batch_size])
+            self.utmos_threshold = stats.threshold(mode=self.utmos_mode, dynamic_type=self.utmos_dynamic_type)
+            print(f"[UTMOS threshold] = {self.utmos_threshold:.4f}")
+        elif self.utmos_threshold is None:
+            self.utmos_threshold = calculate_utmos_threshold_from_scores(
+                matrix.utmos,
+                mode=self.utmos_mode,
+                dynamic_type=self.utmos_dynamic_type
+            )
+            print(f"[UTMOS threshold] = {self.utmos_threshold:.4f}")
+
+        print(f't : {self.t}, beta : {self.beta}')
         out.parent.mkdir(parents=True, exist_ok=True)
-        with out.open('w', encoding='utf-8') as f:
-            for s in filtered_samples:
-                json.dump(s, f, ensure_ascii=False)
-                f.write("\n")
-        print(f"Selection output saved to: {out}")
\ No newline at end of file
+        num_kept = 0
+        with inp.open('rb') as infile, out.open('wb') as f, \
+                tqdm(total=matrix.num_rows, desc='Filtering JamoBigram samples') as pbar:
+            for start in range(0, matrix.num_rows, batch_size):
+                end = min(start + batch_size, matrix.num_rows)
+                thresholds = (group_table[group_codes[start:end]]
+                              if group_codes is not None else self.utmos_threshold)
+                for i in self._select_sparse_rows(matrix, start, end, thresholds):
+                    f.write(matrix.read_line(infile, i))
+                    num_kept += 1
+                pbar.update(end - start)
+        print(f"Filtered {num_kept} / {matrix.num_rows} samples")
+        print(f"Selection output saved to: {out}")
+
+    def _sparse_group_thresholds(self, inp: Path, matrix: SparseJamoBigram, batch_size: int = 8192):
+        """
+        Computes the group thresholds for the sidecar rows in one scan of its JSONL (for the
+        utmos_group_field values; scores come from the sidecar). Returns (an int32 group code
+        per row, the threshold of each code).
+        """
+        stats = GroupedUtmosEstimator()
+        code_of_group: dict[str | None, int] = {}
+        group_codes = np.empty(matrix.num_rows, dtype=np.int32)
+        start = 0
+        with inp.open('rb') as f:
+            for lines in iter_line_batches(f, batch_size):
+                groups = [utmos_group_key(json.loads(line), self.utmos_group_field) for line in lines]
+                end = start + len(groups)
+                group_codes[start:end] = [code_of_group.setdefault(g, len(code_of_group)) for g in groups]
+                stats.update(groups, matrix.utmos[start:end])
+                start = end
+        if start != matrix.num_rows:
+            raise ValueError(f"{inp} has {start} lines but its sidecar has {matrix.num_rows} rows")
+        self.group_utmos_thresholds, self.utmos_threshold = stats.thresholds(
+            self.utmos_min_group_size, mode=self.utmos_mode, dynamic_type=self.utmos_dynamic_type
+        )
+        print(f"[UTMOS threshold] = {self.utmos_threshold:.4f} (overall)")
+        group_table = np.array([self.group_utmos_thresholds.get(g, self.utmos_threshold) for g in code_of_group],
+                               dtype=np.float64)
+        return group_codes, group_table
+
+    def _select_sparse_rows(self, matrix: SparseJamoBigram, start: int, end: int,
+                            utmos_threshold=None) -> list[int]:
+        """
+        Returns the kept row numbers among rows start..end-1 of the sidecar, against
+        utmos_threshold (a scalar or one per row).
+        """
+        thresholds = (np.broadcast_to(np.asarray(utmos_threshold, dtype=np.float64), (end - start,))
+                      if utmos_threshold is not None else [None] * (end - start))
+        # Records without 'utmos' count as 0, as in filter_samples
+        utmos = np.nan_to_num(matrix.utmos[start:end], nan=0.0)
+        if self.selection_engine == "vectorized":
+            nnz_start, nnz_end = int(matrix.indptr[start]), int(matrix.indptr[end])
+            mask = self.selection_mask(
+                matrix.indptr[start:end + 1] - nnz_start, matrix.indices[nnz_start:nnz_end], utmos,
+                self.t, self.beta, utmos_threshold, matrix.record_key[start:end]
+            )
+            return (start + np.flatnonzero(mask)).tolist()
+        return [
+            i for i in range(start, end)
+            if self.should_keep_sample(matrix.row_dict(i), float(utmos[i - start]),
+                                       self.t, self.beta, thresholds[i - start],
+                                       int(matrix.record_key[i]))
+        ]
+
+
+def ngram_field(ngram: int) -> str:
+    """
+    Record field holding the jamo n-gram counts: 'JamoBigram' for n = 2, else 'Jamo{n}gram'.
+    """
+    return "JamoBigram" if ngram == 2 else f"Jamo{ngram}gram"
+
+
+def segment_sum(values, indptr) -> np.ndarray:
+    """
+    Sums values over the CSR row segments values[indptr[i]:indptr[i+1]] (0 for empty rows).
+    """
+    values = np.asarray(values, dtype=np.float64)
+    indptr = np.asarray(indptr, dtype=np.int64)
+    sums = np.zeros(len(indptr) - 1, dtype=np.float64)
+    nonempty = indptr[:-1] < indptr[1:]
+    if nonempty.any():
+        # Empty rows share their start with the next row, so reduceat over the
+        # starts of non-empty rows sums exactly each non-empty segment
+        sums[nonempty] = np.add.reduceat(values[:indptr[-1]], indptr[:-1][nonempty])
+    return sums
+
+
+def iter_line_batches(f, batch_size: int):
+    """
+    Yields lists of at most batch_size lines from an open text file.
+    """
+    batch = []
+    for line in f:
+        batch.append(line)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def imap_ordered(executor, fn, iterable, max_in_flight: int):
+    """
+    Like executor.map, but keeps at most max_in_flight tasks submitted so the
+    input is consumed lazily. Results are yielded in input order.
+    """
+    pending = collections.deque()
+    for item in iterable:
+        pending.append(executor.submit(fn, item))
+        if len(pending) >= max_in_flight:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+# Per-process JamoBigram used by apply_jamobigram's worker pool
+_WORKER_JAMOBIGRAM = None
+
+
+def _init_jamobigram_worker(record_id_field, ngram=2, hash_bits=20):
+    global _WORKER_JAMOBIGRAM
+    _WORKER_JAMOBIGRAM = JamoBigram(num_workers=1, record_id_field=record_id_field, ngram=ngram, hash_bits=hash_bits)
+
+
+def _annotate_lines_in_worker(lines):
+    return _WORKER_JAMOBIGRAM.annotate_lines(lines)
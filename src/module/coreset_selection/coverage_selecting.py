@@ -0,0 +1,137 @@
+import heapq
+from pathlib import Path
+import numpy as np
+from tqdm import tqdm
+
+from module.coreset_selection.core_jamo_selecting import segment_sum
+from module.coreset_selection.sparse_jamobigram import SparseJamoBigram
+from module.coreset_selection.utils import calculate_utmos_threshold_from_scores
+
+
+class CoverageSelector:
+    """
+    Coreset selection that maximizes jamo bigram coverage under an hours budget.
+
+    The objective is f(S) = Σ_b min(c_b(S), cap), where c_b(S) is the count of bigram b
+    over the selected records S: every occurrence counts until a bigram has been seen cap
+    times, so rare bigrams keep their value while frequent ones saturate. f is monotone
+    submodular, and records are picked greedily by marginal gain per second of audio.
+    Gains only shrink as S grows, so a priority queue of stale gains is re-evaluated
+    lazily (lazy greedy): only the top record is recomputed, and it is taken if it still
+    beats the next stale bound.
+
+    Works on the SparseJamoBigram sidecar written by JamoBigram.apply_jamobigram and
+    writes the kept lines in input order, in the same JSONL format as run_selection.
+    """
+    def __init__(
+        self,
+        budget_hours: float,
+        cap: int = 500,
+        utmos_threshold: float | None = None,
+        utmos_mode: str = "dynamic",
+        utmos_dynamic_type: str = "mad",
+        initial_coverage: np.ndarray | None = None,
+    ):
+        """
+        budget_hours: total duration of the selected records, in hours.
+        cap: number of occurrences after which a bigram adds no more value (like t of JamoBigram).
+        utmos_threshold: records below it are not candidates; computed from the sidecar's
+            scores with utmos_mode / utmos_dynamic_type when None. Missing scores count as 0.
+        initial_coverage: bigram counts already covered (e.g. by datasets selected before),
+            indexed by bigram ID.
+        """
+        self.budget_hours = budget_hours
+        self.cap = cap
+        self.utmos_threshold = utmos_threshold
+        self.utmos_mode = utmos_mode
+        self.utmos_dynamic_type = utmos_dynamic_type
+        self.initial_coverage = initial_coverage
+        # Bigram counts of the selection, available after select()
+        self.coverage = None
+
+    def select(self, matrix: SparseJamoBigram) -> np.ndarray:
+        """
+        Returns the selected row numbers of the sidecar, in input order.
+        """
+        if self.utmos_threshold is None:
+            self.utmos_threshold = calculate_utmos_threshold_from_scores(
+                matrix.utmos,
+                mode=self.utmos_mode,
+                dynamic_type=self.utmos_dynamic_type
+            )
+            print(f"[UTMOS threshold] = {self.utmos_threshold:.4f}")
+
+        coverage = np.zeros(matrix.num_pair_ids, dtype=np.int64)
+        if self.initial_coverage is not None:
+            coverage += np.asarray(self.initial_coverage, dtype=np.int64)
+        # Plain ndarray views of the memory maps: slicing np.memmap per row is several times slower
+        indptr, indices, data = np.asarray(matrix.indptr), np.asarray(matrix.indices), np.asarray(matrix.data)
+        duration = np.asarray(matrix.duration, dtype=np.float64)
+        utmos = np.nan_to_num(matrix.utmos, nan=0.0)
+        candidate = (utmos >= self.utmos_threshold) & (duration > 0)
+        print(f"[Coverage] {int(candidate.sum())} / {matrix.num_rows} candidate records "
+              f"(UTMOS >= threshold, duration > 0)")
+
+        # Initial gains with the initial coverage, all rows at once
+        remaining = np.maximum(self.cap - coverage, 0)
+        initial_gain = segment_sum(np.minimum(data, remaining[indices]), indptr)
+        candidate_rows = np.flatnonzero(candidate)
+        ratios = (initial_gain[candidate] / duration[candidate]).tolist()
+        heap = [(-ratio, i) for ratio, i in zip(ratios, candidate_rows.tolist()) if ratio > 0]
+        heapq.heapify(heap)
+
+        budget = self.budget_hours * 3600.0
+        used = 0.0
+        selected = []
+        with tqdm(total=len(heap), desc='Coverage selection') as pbar:
+            while heap:
+                _, i = heapq.heappop(heap)
+                cost = float(duration[i])
+                if used + cost > budget:
+                    pbar.update(1)
+                    continue
+                ids, counts = indices[indptr[i]:indptr[i + 1]], data[indptr[i]:indptr[i + 1]]
+                gain = int(np.minimum(counts, np.maximum(self.cap - coverage[ids], 0)).sum())
+                if gain <= 0:
+                    pbar.update(1)
+                    continue
+                ratio = gain / cost
+                if heap and ratio < -heap[0][0]:
+                    # Stale bound: push back with the fresh one and look at the new top
+                    heapq.heappush(heap, (-ratio, i))
+                    continue
+                coverage[ids] += counts
+                used += cost
+                selected.append(i)
+                pbar.update(1)
+
+        self.coverage = coverage
+        # Objective with every candidate selected (no budget), for reference
+        base = np.zeros(matrix.num_pair_ids, dtype=np.int64)
+        if self.initial_coverage is not None:
+            base += np.asarray(self.initial_coverage, dtype=np.int64)
+        entry_candidate = np.repeat(candidate, np.diff(indptr))
+        candidate_counts = base + np.bincount(indices[entry_candidate], weights=data[entry_candidate],
+                                              minlength=matrix.num_pair_ids).astype(np.int64)
+        print(f"[Coverage] Selected {len(selected)} records, {used / 3600:.2f} / {self.budget_hours:.2f} hours, "
+              f"objective {int(np.minimum(coverage, self.cap).sum())} / "
+              f"{int(np.minimum(candidate_counts, self.cap).sum())}, "
+              f"bigrams covered {int((coverage > 0).sum())} / {int((candidate_counts > 0).sum())}")
+        return np.sort(np.array(selected, dtype=np.int64))
+
+    def run_selection(self, input_jsonl: str, output_jsonl: str, sparse_input: str) -> None:
+        """
+        Selects records of input_jsonl (a JamoBigram-applied JSONL) using its sidecar and
+        copies the kept lines to output_jsonl as they are.
+        """
+        inp = Path(input_jsonl)
+        out = Path(output_jsonl)
+        matrix = SparseJamoBigram.load(sparse_input)
+        matrix.check_jsonl(inp)
+        kept_rows = self.select(matrix)
+        out.parent.mkdir(parents=True, exist_ok=True)
+        with inp.open('rb') as infile, out.open('wb') as f:
+            for i in kept_rows.tolist():
+                f.write(matrix.read_line(infile, i))
+        print(f"Filtered {len(kept_rows)} / {matrix.num_rows} samples")
+        print(f"Selection output saved to: {out}")
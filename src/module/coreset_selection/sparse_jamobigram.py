@@ -0,0 +1,188 @@
+import json
+from pathlib import Path
+import numpy as np
+
+SPARSE_FORMAT_VERSION = 2
+
+
+class SparseJamoBigram:
+    """
+    CSR matrix of records × bigram IDs for a JamoBigram-applied JSONL.
+
+    Row i holds the 'JamoBigram' counts of the i-th line of the JSONL, whose bytes are
+    line_offsets[i]:line_offsets[i+1]. 'utmos' and 'duration' are stored per row
+    (NaN and 0 respectively when a record has no such field), together with the
+    record's stable_record_key. Arrays are kept as raw binary files in one directory
+    with a meta.json, and are loaded as read-only memory maps.
+    """
+    ARRAY_DTYPES = {
+        "indptr": np.int64,
+        "indices": np.int32,
+        "data": np.int32,
+        "line_offsets": np.int64,
+        "utmos": np.float64,
+        "duration": np.float64,
+        "record_key": np.uint64,
+    }
+
+    def __init__(
+        self,
+        indptr: np.ndarray,
+        indices: np.ndarray,
+        data: np.ndarray,
+        line_offsets: np.ndarray,
+        utmos: np.ndarray,
+        duration: np.ndarray,
+        record_key: np.ndarray,
+        num_pair_ids: int,
+        jsonl_path: str | None = None,
+        record_id_field: str | None = None,
+    ):
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+        self.line_offsets = line_offsets
+        self.utmos = utmos
+        self.duration = duration
+        self.record_key = record_key
+        self.num_pair_ids = num_pair_ids
+        self.jsonl_path = jsonl_path
+        self.record_id_field = record_id_field
+
+    @property
+    def num_rows(self) -> int:
+        return len(self.indptr) - 1
+
+    def row(self, i: int) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Returns (bigram IDs, counts) of row i.
+        """
+        start, end = self.indptr[i], self.indptr[i + 1]
+        return self.indices[start:end], self.data[start:end]
+
+    def row_dict(self, i: int) -> dict[int, int]:
+        ids, counts = self.row(i)
+        return dict(zip(ids.tolist(), counts.tolist()))
+
+    def read_line(self, f, i: int) -> bytes:
+        """
+        Reads the JSONL line of row i (including its newline) from a file opened in binary mode.
+        """
+        start, end = int(self.line_offsets[i]), int(self.line_offsets[i + 1])
+        f.seek(start)
+        return f.read(end - start)
+
+    def check_jsonl(self, jsonl_path) -> None:
+        """
+        Raises ValueError unless jsonl_path has exactly the bytes the sidecar was written
+        for, so read_line cannot copy truncated or mis-split lines from a stale or
+        mismatched sidecar.
+        """
+        size = Path(jsonl_path).stat().st_size
+        expected = int(self.line_offsets[-1])
+        if size != expected:
+            raise ValueError(f"{jsonl_path} has {size} bytes but its sidecar was written for "
+                             f"{self.jsonl_path} with {expected} bytes; rebuild the sidecar")
+
+    @classmethod
+    def load(cls, sparse_dir: str) -> "SparseJamoBigram":
+        """
+        Memory-maps a sidecar directory written by SparseJamoBigramWriter.
+        """
+        meta, arrays = load_memmap_arrays(sparse_dir, cls.ARRAY_DTYPES, SPARSE_FORMAT_VERSION,
+                                          "sparse JamoBigram")
+        return cls(num_pair_ids=meta["num_pair_ids"], jsonl_path=meta.get("jsonl_path"),
+                   record_id_field=meta.get("record_id_field"), **arrays)
+
+
+class SparseJamoBigramWriter:
+    """
+    Streams rows of a SparseJamoBigram sidecar to disk batch by batch, so memory does not
+    grow with the number of records. Use as a context manager; meta.json is written on close.
+    """
+    def __init__(self, sparse_dir: str, num_pair_ids: int, jsonl_path: str | None = None,
+                 record_id_field: str | None = None):
+        self.sparse_dir = Path(sparse_dir)
+        self.sparse_dir.mkdir(parents=True, exist_ok=True)
+        self.num_pair_ids = num_pair_ids
+        self.jsonl_path = jsonl_path
+        self.record_id_field = record_id_field
+        self.files = {
+            name: (self.sparse_dir / f"{name}.bin").open("wb")
+            for name in SparseJamoBigram.ARRAY_DTYPES
+        }
+        self.num_rows = 0
+        self.nnz = 0
+        self.byte_offset = 0
+        self._write("indptr", [0])
+        self._write("line_offsets", [0])
+
+    def _write(self, name: str, values) -> None:
+        dtype = SparseJamoBigram.ARRAY_DTYPES[name]
+        self.files[name].write(np.asarray(values, dtype=dtype).tobytes())
+
+    def append_batch(
+        self,
+        row_nnz: np.ndarray,
+        ids: np.ndarray,
+        counts: np.ndarray,
+        line_lengths: np.ndarray,
+        utmos: np.ndarray,
+        duration: np.ndarray,
+        record_key: np.ndarray,
+    ) -> None:
+        """
+        Appends a batch of rows. row_nnz[j] entries of ids/counts belong to the j-th row,
+        whose JSONL line (with newline) is line_lengths[j] bytes long.
+        """
+        row_nnz = np.asarray(row_nnz, dtype=np.int64)
+        line_lengths = np.asarray(line_lengths, dtype=np.int64)
+        self._write("indptr", self.nnz + np.cumsum(row_nnz))
+        self._write("line_offsets", self.byte_offset + np.cumsum(line_lengths))
+        self._write("indices", ids)
+        self._write("data", counts)
+        self._write("utmos", utmos)
+        self._write("duration", duration)
+        self._write("record_key", record_key)
+        self.num_rows += len(row_nnz)
+        self.nnz += int(row_nnz.sum())
+        self.byte_offset += int(line_lengths.sum())
+
+    def close(self) -> None:
+        for f in self.files.values():
+            f.close()
+        meta = {
+            "format_version": SPARSE_FORMAT_VERSION,
+            "num_pair_ids": self.num_pair_ids,
+            "num_rows": self.num_rows,
+            "nnz": self.nnz,
+            "jsonl_path": self.jsonl_path,
+            "record_id_field": self.record_id_field,
+        }
+        (self.sparse_dir / "meta.json").write_text(json.dumps(meta, indent=2), encoding="utf-8")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def load_memmap_arrays(array_dir: str, array_dtypes: dict, format_version: int,
+                       kind: str) -> tuple[dict, dict]:
+    """
+    Reads the meta.json of a directory of raw binary arrays (<name>.bin) and memory-maps
+    every array of array_dtypes read-only. Raises ValueError if meta.json does not have
+    format_version (kind names the format in the message). Returns (meta, arrays).
+    """
+    array_dir = Path(array_dir)
+    meta = json.loads((array_dir / "meta.json").read_text(encoding="utf-8"))
+    if meta.get("format_version") != format_version:
+        raise ValueError(f"Unsupported {kind} format in {array_dir}: {meta.get('format_version')}")
+    arrays = {}
+    for name, dtype in array_dtypes.items():
+        path = array_dir / f"{name}.bin"
+        # np.memmap cannot map empty files
+        arrays[name] = (np.memmap(path, dtype=dtype, mode="r") if path.stat().st_size
+                        else np.empty(0, dtype=dtype))
+    return meta, arrays
@@ -1,4 +1,6 @@
+from array import array
 from pathlib import Path
+import hashlib
 import json
 import numpy as np
 import jieba
@@ -15,7 +17,7 @@ def convert_char_to_jamo(text_list, polyphone=True):
     
     final_text_list = []
     god_knows_why_en_testset_contains_zh_quote = str.maketrans(
-        {""": '"', """: '"', "'": "'", "'": "'"}
+        {"“": '"', "”": '"', "‘": "'", "’": "'"}
     )
     custom_trans = str.maketrans({";": ","})
 
@@ -73,6 +75,50 @@ def convert_char_to_jamo(text_list, polyphone=True):
     return final_text_list
 
 
+def stable_record_key(record: dict, record_id_field: str = "wav") -> int:
+    """
+    Returns a 64-bit key for a record that does not depend on its position in a file:
+    a hash of record[record_id_field], or of the whole record if that field is missing.
+    """
+    value = record.get(record_id_field)
+    text = str(value) if value is not None else json.dumps(record, ensure_ascii=False, sort_keys=True)
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def file_content_hash(path, chunk_size: int = 1 << 20) -> str:
+    """
+    Returns the hex blake2b digest of a file's bytes, used to recognize a dataset
+    regardless of its name or location.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    with Path(path).open("rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _splitmix64(x: np.ndarray) -> np.ndarray:
+    x = x + np.uint64(0x9E3779B97F4A7C15)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def counter_uniform(seed: int, keys, counters=0) -> np.ndarray:
+    """
+    Counter-based uniform draws in [0, 1): draw number `counters` of the stream keyed on
+    (seed, key). The value depends only on (seed, key, counter), never on how many other
+    draws were made before, so any sharding or ordering of records gives identical draws.
+    """
+    keys = np.asarray(keys, dtype=np.uint64)
+    counters = np.asarray(counters, dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        x = _splitmix64(np.full(keys.shape, seed & 0xFFFFFFFFFFFFFFFF, dtype=np.uint64))
+        x = _splitmix64(x ^ keys)
+        x = _splitmix64(x ^ counters)
+    return (x >> np.uint64(11)).astype(np.float64) * (1.0 / (1 << 53))
+
+
 def calculate_utmos_threshold(jsonl_path: Path,
                                mode: str = "dynamic",
                                static_value: float = 3.5,
@@ -81,7 +127,9 @@ def calculate_utmos_threshold(jsonl_path: Path,
                                q: float = 0.60,
                                k_max: float = 0.0,
                                k_min: float = 2.5,
-                               mu_ref: float = 3.0) -> float:
+                               mu_ref: float = 3.0,
+                               estimator: str = "exact",
+                               compression: float = 200) -> float:
     """
     Calculates the filtering threshold based on the 'utmos' distribution within jsonl_path.
     
@@ -92,23 +140,75 @@ def calculate_utmos_threshold(jsonl_path: Path,
         - "mu+xsigma" : τ = μ - x·σ
         - "quantile"  : τ = F^{-1}(q)
         - "mad"       : τ = median - k·MAD
+    estimator:
+        - "exact"   : keeps every score (8 bytes per record) and computes exact statistics.
+        - "tdigest" : one pass with fixed memory through StreamingUtmosEstimator(compression);
+                      see its docstring for the error bounds.
     """
 
     if mode == "static":
         print(f"[UTMOS Threshold] Static mode. Returning: {static_value}")
         return static_value
 
-    # Read UTMOS scores
-    scores = []
-    with jsonl_path.open("r", encoding="utf-8") as f:
+    if estimator == "tdigest":
+        stats = StreamingUtmosEstimator(compression)
+        with Path(jsonl_path).open("r", encoding="utf-8") as f:
+            batch = []
+            for line in f:
+                if not line.strip():
+                    continue
+                data = json.loads(line)
+                if "utmos" in data:
+                    batch.append(float(data["utmos"]))
+                    if len(batch) >= 8192:
+                        stats.update(batch)
+                        batch = []
+            stats.update(batch)
+        if not stats.count:
+            raise ValueError(f"⚠️ No 'utmos' values found in {jsonl_path}")
+        return stats.threshold(mode, static_value, dynamic_type, x, q, k_max, k_min, mu_ref)
+    elif estimator != "exact":
+        raise ValueError("Invalid estimator: choose 'exact' or 'tdigest'")
+
+    # Read UTMOS scores (packed as doubles: 8 bytes per record instead of a Python float each)
+    scores = array("d")
+    with Path(jsonl_path).open("r", encoding="utf-8") as f:
         for line in f:
+            if not line.strip():
+                continue
             data = json.loads(line)
             if "utmos" in data:
                 scores.append(float(data["utmos"]))
     if not scores:
         raise ValueError(f"⚠️ No 'utmos' values found in {jsonl_path}")
 
-    scores = np.array(scores)
+    return calculate_utmos_threshold_from_scores(
+        np.frombuffer(scores, dtype=np.float64), mode, static_value, dynamic_type, x, q, k_max, k_min, mu_ref
+    )
+
+
+def calculate_utmos_threshold_from_scores(scores: np.ndarray,
+                                          mode: str = "dynamic",
+                                          static_value: float = 3.5,
+                                          dynamic_type: str = "mad",
+                                          x: float = 0.5,
+                                          q: float = 0.60,
+                                          k_max: float = 0.0,
+                                          k_min: float = 2.5,
+                                          mu_ref: float = 3.0) -> float:
+    """
+    Same as calculate_utmos_threshold, for UTMOS scores already in memory
+    (e.g., the 'utmos' column of a SparseJamoBigram sidecar). NaN scores are ignored.
+    """
+    if mode == "static":
+        print(f"[UTMOS Threshold] Static mode. Returning: {static_value}")
+        return static_value
+
+    scores = np.asarray(scores, dtype=np.float64)
+    scores = scores[~np.isnan(scores)]
+    if not len(scores):
+        raise ValueError("⚠️ No 'utmos' values found")
+
     mu, sig = scores.mean(), scores.std()
     print(f"[UTMOS Threshold] Dynamic mode. μ: {mu:.4f}, σ: {sig:.4f}")
 
@@ -119,13 +219,7 @@ def calculate_utmos_threshold(jsonl_path: Path,
         return float(np.quantile(scores, q))
 
     elif dynamic_type == "mad":
-        if mu >= mu_ref:
-            k = k_max
-        else:
-            ratio = (mu_ref - mu) / mu_ref
-            k = max(k_min, k_max * (1 - ratio))
-            print(f"[UTMOS Threshold] Dynamic k: {k:.4f}")
-
+        k = _dynamic_mad_k(mu, k_max, k_min, mu_ref)
         med = np.median(scores)
         if _HAS_SCIPY:
             mad = median_abs_deviation(scores, scale="normal")
@@ -135,4 +229,284 @@ def calculate_utmos_threshold(jsonl_path: Path,
         return float(med - k * mad)
 
     else:
-        raise ValueError("Invalid dynamic_type: choose 'mu+xsigma', 'quantile', or 'mad'")
\ No newline at end of file
+        raise ValueError("Invalid dynamic_type: choose 'mu+xsigma', 'quantile', or 'mad'")
+
+
+def _dynamic_mad_k(mu: float, k_max: float, k_min: float, mu_ref: float, verbose: bool = True) -> float:
+    """
+    k of the "mad" threshold: k_max for a distribution centred at or above mu_ref, else
+    interpolated towards k_min as the mean drops.
+    """
+    if mu >= mu_ref:
+        return k_max
+    ratio = (mu_ref - mu) / mu_ref
+    k = max(k_min, k_max * (1 - ratio))
+    if verbose:
+        print(f"[UTMOS Threshold] Dynamic k: {k:.4f}")
+    return k
+
+
+class StreamingUtmosEstimator:
+    """
+    One-pass, fixed-memory statistics of a stream of UTMOS scores, for the thresholds of
+    calculate_utmos_threshold without keeping the scores.
+
+    - mean / standard deviation: exact, by Welford's algorithm (batches combined with
+      Chan's parallel update), so "mu+xsigma" matches the exact threshold.
+    - quantiles: a merging t-digest with the k1 scale function k(q) = δ/(2π)·asin(2q-1)
+      and compression δ. Every centroid spans at most one unit of k, i.e. a rank width of
+      about 2π·sqrt(q(1-q))/δ, so with interpolation the rank error of quantile(q) is
+      bounded by ≈ π·sqrt(q(1-q))/δ (≈ 0.0079 for the median at δ = 200) and shrinks
+      towards the tails. At most ≈ δ/2 centroids are kept, plus a buffer of `buffer_size`
+      scores.
+    - MAD: solved on the digest's CDF (F(median + m) - F(median - m) = 1/2), so its error
+      follows from the quantile bound above.
+
+    update() takes any number of scores, so it can run inside a pass that reads records
+    for other work; merge() combines estimators built on different shards.
+    """
+    def __init__(self, compression: float = 200, buffer_size: int = 8192):
+        self.compression = compression
+        self.buffer_size = buffer_size
+        self.count = 0
+        self._mean = 0.0
+        self._m2 = 0.0
+        self.min = float("inf")
+        self.max = float("-inf")
+        self.centroid_means = np.empty(0, dtype=np.float64)
+        self.centroid_weights = np.empty(0, dtype=np.float64)
+        self._buffer = []
+        self._buffered = 0
+
+    def update(self, scores) -> None:
+        """
+        Adds a score or an iterable of scores; NaN scores are ignored.
+        """
+        scores = np.atleast_1d(np.asarray(scores, dtype=np.float64))
+        scores = scores[~np.isnan(scores)]
+        if not len(scores):
+            return
+        n = len(scores)
+        batch_mean = float(scores.mean())
+        batch_m2 = float(((scores - batch_mean) ** 2).sum())
+        total = self.count + n
+        delta = batch_mean - self._mean
+        self._mean += delta * n / total
+        self._m2 += batch_m2 + delta * delta * self.count * n / total
+        self.count = total
+        self.min = min(self.min, float(scores.min()))
+        self.max = max(self.max, float(scores.max()))
+        # Compress every buffer_size scores exactly, so the digest depends only on the
+        # sequence of scores and not on how they were split into update() calls
+        while len(scores):
+            take = self.buffer_size - self._buffered
+            self._buffer.append(scores[:take])
+            self._buffered += len(scores[:take])
+            scores = scores[take:]
+            if self._buffered >= self.buffer_size:
+                self._compress()
+
+    def merge(self, other: "StreamingUtmosEstimator") -> None:
+        """
+        Adds the scores summarized by another estimator (e.g. built on another shard).
+        """
+        if not other.count:
+            return
+        other._compress()
+        total = self.count + other.count
+        delta = other._mean - self._mean
+        self._mean += delta * other.count / total
+        self._m2 += other._m2 + delta * delta * self.count * other.count / total
+        self.count = total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress(other.centroid_means, other.centroid_weights)
+
+    def _compress(self, extra_means=None, extra_weights=None) -> None:
+        """
+        Merges the buffered scores (and extra centroids) into the digest: points sorted by
+        value are grouped by floor(k(q)) of the weight before them, one centroid per group.
+        """
+        means = [self.centroid_means, *self._buffer]
+        weights = [self.centroid_weights, *(np.ones(len(b)) for b in self._buffer)]
+        if extra_means is not None:
+            means.append(extra_means)
+            weights.append(extra_weights)
+        self._buffer = []
+        self._buffered = 0
+        means, weights = np.concatenate(means), np.concatenate(weights)
+        if not len(means):
+            return
+        order = np.argsort(means, kind="stable")
+        means, weights = means[order], weights[order]
+        q_before = (np.cumsum(weights) - weights) / weights.sum()
+        k = self.compression / (2 * np.pi) * np.arcsin(2 * q_before - 1)
+        groups = np.floor(k - k[0]).astype(np.int64)
+        starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+        group_weights = np.add.reduceat(weights, starts)
+        self.centroid_means = np.add.reduceat(means * weights, starts) / group_weights
+        self.centroid_weights = group_weights
+
+    def _interpolation_points(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Returns (values, ranks): min, every centroid mean at the rank of its middle, and max.
+        """
+        self._compress()
+        ranks = np.cumsum(self.centroid_weights) - self.centroid_weights / 2
+        values = np.r_[self.min, self.centroid_means, self.max]
+        return values, np.r_[0.0, ranks, float(self.count)]
+
+    @property
+    def mean(self) -> float:
+        return self._mean
+
+    @property
+    def std(self) -> float:
+        """
+        Population standard deviation (as np.std).
+        """
+        return float(np.sqrt(self._m2 / self.count)) if self.count else 0.0
+
+    def quantile(self, q: float) -> float:
+        values, ranks = self._interpolation_points()
+        return float(np.interp(q * self.count, ranks, values))
+
+    def cdf(self, x) -> np.ndarray:
+        values, ranks = self._interpolation_points()
+        return np.interp(x, values, ranks) / self.count
+
+    def median(self) -> float:
+        return self.quantile(0.5)
+
+    def mad(self, scale: float = 1.4826, iterations: int = 60) -> float:
+        """
+        Median absolute deviation (scaled as median_abs_deviation(scale="normal")), found by
+        bisection on m for F(median + m) - F(median - m) = 1/2.
+        """
+        med = self.median()
+        lo, hi = 0.0, max(self.max - med, med - self.min)
+        for _ in range(iterations):
+            m = (lo + hi) / 2
+            if self.cdf(med + m) - self.cdf(med - m) < 0.5:
+                lo = m
+            else:
+                hi = m
+        return scale * (lo + hi) / 2
+
+    def threshold(self,
+                  mode: str = "dynamic",
+                  static_value: float = 3.5,
+                  dynamic_type: str = "mad",
+                  x: float = 0.5,
+                  q: float = 0.60,
+                  k_max: float = 0.0,
+                  k_min: float = 2.5,
+                  mu_ref: float = 3.0,
+                  verbose: bool = True) -> float:
+        """
+        Same thresholds as calculate_utmos_threshold_from_scores, from the streamed statistics.
+        """
+        if mode == "static":
+            if verbose:
+                print(f"[UTMOS Threshold] Static mode. Returning: {static_value}")
+            return static_value
+        if not self.count:
+            raise ValueError("⚠️ No 'utmos' values found")
+
+        mu, sig = self.mean, self.std
+        if verbose:
+            print(f"[UTMOS Threshold] Dynamic mode. μ: {mu:.4f}, σ: {sig:.4f}")
+
+        if dynamic_type == "mu+xsigma":
+            return float(mu - x * sig)
+        elif dynamic_type == "quantile":
+            return self.quantile(q)
+        elif dynamic_type == "mad":
+            k = _dynamic_mad_k(mu, k_max, k_min, mu_ref, verbose)
+            return float(self.median() - k * self.mad())
+        else:
+            raise ValueError("Invalid dynamic_type: choose 'mu+xsigma', 'quantile', or 'mad'")
+
+
+class GroupedUtmosEstimator:
+    """
+    One StreamingUtmosEstimator per group (dataset, speaker, or any record field value)
+    plus one over all scores, filled in a single pass. Group digests use a small buffer, so
+    memory stays at a few KB per group even with thousands of speakers.
+    """
+    def __init__(self, compression: float = 200, group_buffer_size: int = 256):
+        self.compression = compression
+        self.group_buffer_size = group_buffer_size
+        self.overall = StreamingUtmosEstimator(compression)
+        self.groups: dict[str, StreamingUtmosEstimator] = {}
+
+    def update(self, groups, scores) -> None:
+        """
+        Adds scores[i] to the group groups[i]; a group of None only counts towards the
+        overall statistics. NaN scores are ignored.
+        """
+        scores = np.asarray(scores, dtype=np.float64)
+        self.overall.update(scores)
+        by_group = {}
+        for group, score in zip(groups, scores.tolist()):
+            if group is not None:
+                by_group.setdefault(group, []).append(score)
+        for group, group_scores in by_group.items():
+            if group not in self.groups:
+                self.groups[group] = StreamingUtmosEstimator(self.compression, self.group_buffer_size)
+            self.groups[group].update(group_scores)
+
+    def thresholds(self, min_group_size: int = 50, **threshold_kwargs) -> tuple[dict[str, float], float]:
+        """
+        Returns ({group: threshold}, overall threshold). Groups with fewer than
+        min_group_size scores are left out, so their records fall back to the overall one.
+        threshold_kwargs are those of StreamingUtmosEstimator.threshold.
+        """
+        overall = self.overall.threshold(**threshold_kwargs)
+        grouped = {
+            group: stats.threshold(**threshold_kwargs, verbose=False)
+            for group, stats in self.groups.items()
+            if stats.count >= min_group_size
+        }
+        print(f"[UTMOS Threshold] {len(grouped)} / {len(self.groups)} groups with their own threshold "
+              f"(min_group_size={min_group_size}); others use {overall:.4f}")
+        return grouped, overall
+
+
+def utmos_group_key(record: dict, group_field: str) -> str | None:
+    """
+    Group of a record for grouped thresholds: str(record[group_field]), or None if missing.
+    """
+    value = record.get(group_field)
+    return None if value is None else str(value)
+
+
+def calculate_grouped_utmos_thresholds(jsonl_path: Path,
+                                       group_field: str,
+                                       min_group_size: int = 50,
+                                       compression: float = 200,
+                                       **threshold_kwargs) -> tuple[dict[str, float], float]:
+    """
+    Calculates one UTMOS threshold per value of record[group_field] (e.g. "dataset" or
+    "speaker") in a single scan of jsonl_path, with per-group streaming statistics.
+    Returns ({group: threshold}, overall threshold); records of groups that are missing or
+    smaller than min_group_size should use the overall threshold.
+    threshold_kwargs are those of calculate_utmos_threshold (mode, dynamic_type, x, q, ...).
+    """
+    stats = GroupedUtmosEstimator(compression)
+    with Path(jsonl_path).open("r", encoding="utf-8") as f:
+        groups, scores = [], []
+        for line in f:
+            if not line.strip():
+                continue
+            data = json.loads(line)
+            if "utmos" in data:
+                groups.append(utmos_group_key(data, group_field))
+                scores.append(float(data["utmos"]))
+                if len(scores) >= 8192:
+                    stats.update(groups, scores)
+                    groups, scores = [], []
+        stats.update(groups, scores)
+    if not stats.overall.count:
+        raise ValueError(f"⚠️ No 'utmos' values found in {jsonl_path}")
+    return stats.thresholds(min_group_size, **threshold_kwargs)
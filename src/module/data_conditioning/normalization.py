@@ -1,9 +1,65 @@
 from typing_extensions import Text
 import re
-from typing import Union, Literal
+from typing import Callable, Union, Literal
 from pathlib import Path
 from tqdm import tqdm
 import json
+import random
+import time
+
+
+class StageTrace:
+    """
+    Opt-in rule-firing trace for N2gk/N2gkPlus.
+    Records, for each traced sentence, which stages changed the text and how long
+    each stage took, and aggregates these into a per-stage time/hit report.
+    """
+    def __init__(self, sample_rate: float = 1.0, seed: int = 74):
+        self.sample_rate = sample_rate
+        self._rng = random.Random(seed)
+        self.seen = 0
+        self.traced = 0
+        self.seconds: dict[str, float] = {}
+        self.hits: dict[str, int] = {}
+        # (stage name, seconds) for every stage that changed the last traced sentence
+        self.last_changed: list[tuple[str, float]] = []
+
+    def should_trace(self) -> bool:
+        self.seen += 1
+        return self.sample_rate >= 1.0 or self._rng.random() < self.sample_rate
+
+    def run(self, stages: list[tuple[str, Callable[[str], str]]], sentence: str) -> str:
+        self.traced += 1
+        self.last_changed = []
+        for name, stage in stages:
+            start = time.perf_counter()
+            out = stage(sentence)
+            elapsed = time.perf_counter() - start
+            self.seconds[name] = self.seconds.get(name, 0.0) + elapsed
+            if out != sentence:
+                self.hits[name] = self.hits.get(name, 0) + 1
+                self.last_changed.append((name, elapsed))
+            else:
+                self.hits.setdefault(name, 0)
+            sentence = out
+        return sentence
+
+    def report(self, title: str = "Stage trace") -> str:
+        total = sum(self.seconds.values()) or 1.0
+        traced = self.traced or 1
+        lines = [
+            f"[{title}] {self.traced} / {self.seen} sentences traced",
+            f"{'stage':<42}{'total ms':>10}{'us/sent':>10}{'share':>8}{'hits':>10}{'hit %':>8}",
+        ]
+        for name, sec in self.seconds.items():
+            hits = self.hits.get(name, 0)
+            lines.append(
+                f"{name:<42}{sec * 1e3:>10.1f}{sec / traced * 1e6:>10.2f}"
+                f"{sec / total * 100:>7.1f}%{hits:>10}{hits / traced * 100:>7.1f}%"
+            )
+        return "\n".join(lines)
+
+
 class N2gk:
 
     # ------------------- English-Korean Dictionary -------------------
@@ -46,9 +102,10 @@ class N2gk:
     }
 
 
-    def __init__(self, natural=True):
-        self.natural = natural
+    def __init__(self, natural=True, trace=False, trace_sample_rate=1.0):
         self.natural = natural
+        # Per-stage time/hit tracing (see StageTrace); None keeps __call__ on the fast path
+        self.trace = StageTrace(sample_rate=trace_sample_rate) if trace else None
         self.UNIT_CATEGORIES = [
             self.UnitCategory(['명', '사람', '마리','번째','시', '배', '방', '가구', '게임', '건', '세트'], 'native', self),
             self.UnitCategory(['개', '가지', '개비', '잔','번', '장','병', '권', '벌', '곳','시간','척', "차례", '바퀴', '경기', '골'], 'native', self),
@@ -395,28 +452,26 @@ class N2gk:
         return re.sub(pattern, replacer, text)
 
 
-    def __call__(self, sentence: str) -> str: ## super().__call__(sentence)
-
-        sentence = self.apply_exceptions(sentence)
-        #print(f"n2gk : apply exception : {sentence}")
-        sentence = self.convert_english_number(sentence)
-        #print(f"n2gk : convert english number : {sentence}")
-        sentence = self.convert_phone_numbers(sentence)
-        #print(f"n2gk : convert phone numbers : {sentence}")
-
-        #sentence = self.convert_comma_separated_numbers_with_unit(sentence)  # ✅ 이 줄 추가
-
-
-        sentence = self.parse_and_convert_sentence_with_range(sentence)
-        #print(f"n2gk : parse and convert sentence with range : {sentence}")
-
-        sentence = self.insert_space_around_numbers(sentence)
-        #print(f"n2gk : insert space around numbers : {sentence}")
-        sentence = self.convert_float_numbers(sentence)
-        #print(f"n2gk : convert float numbers : {sentence}")
-        sentence = self.convert_pure_numbers(sentence)
-        #print(f"n2gk : conert pure numbers : {sentence}")
+    def stages(self) -> list[tuple[str, Callable[[str], str]]]:
+        """
+        Ordered (name, function) steps applied by __call__.
+        """
+        return [
+            ("apply_exceptions", self.apply_exceptions),
+            ("convert_english_number", self.convert_english_number),
+            ("convert_phone_numbers", self.convert_phone_numbers),
+            #("convert_comma_separated_numbers_with_unit", self.convert_comma_separated_numbers_with_unit),
+            ("parse_and_convert_sentence_with_range", self.parse_and_convert_sentence_with_range),
+            ("insert_space_around_numbers", self.insert_space_around_numbers),
+            ("convert_float_numbers", self.convert_float_numbers),
+            ("convert_pure_numbers", self.convert_pure_numbers),
+        ]
 
+    def __call__(self, sentence: str) -> str:
+        if self.trace is not None and self.trace.should_trace():
+            return self.trace.run(self.stages(), sentence)
+        for _, stage in self.stages():
+            sentence = stage(sentence)
         return sentence
 
     def run_n2gk(
@@ -437,7 +492,11 @@ class N2gk:
                 continue
             data = json.loads(line)
             text = data.get('text', '')
+            traced_before = self.trace.traced if self.trace is not None else 0
             data['N2gk'] = self(text)
+            if self.trace is not None and self.trace.traced > traced_before:
+                # Stages that changed this sentence, with their cost in microseconds
+                data['N2gkTrace'] = {stage: round(sec * 1e6, 1) for stage, sec in self.trace.last_changed}
             records.append(data)
 
         with output_path.open('w', encoding='utf-8') as outf:
@@ -446,6 +505,8 @@ class N2gk:
                 outf.write('\n')
 
         print(f"N2gk-normalized output saved to: {output_path}")
+        if self.trace is not None:
+            print(self.trace.report("N2gk stage trace"))
 
 
 class N2gkPlus(N2gk):
@@ -619,9 +680,9 @@ class N2gkPlus(N2gk):
 
     #HISTORY_EVENT_MAPPING = 
 
-    def __init__(self, natural=True):
+    def __init__(self, natural=True, trace=False, trace_sample_rate=1.0):
      
-        super().__init__(natural)
+        super().__init__(natural, trace=trace, trace_sample_rate=trace_sample_rate)
 
 
         self.WORD_MAPPING = {
@@ -653,7 +714,6 @@ class N2gkPlus(N2gk):
             "(": "", ")": "", "㈜": "", "�": "",
             "ú": "", "◆": "", "ㆍ": "", "\n": "", #"_x000D_": "",
 
-            "": "", "": "",
             "×": "", "°": "", "±": "", "•": "", "™": "",
             "®": "", "©": "",
             "\"": ""
@@ -724,20 +784,15 @@ class N2gkPlus(N2gk):
 
         return pat.sub(_repl, text)
 
-    def __call__(self, sentence: str) -> str:
-        sentence = self.remove_symbols(sentence)
-        #print(f"n2kg+ : remove symbols : {sentence}")
-        sentence = self.apply_special_symbol_mapping(sentence)
-        #print(f"n2gk+ : apply special symbol mapping : {sentence}")
-        sentence = self.apply_single_korean_mapping(sentence)
-        #print(f"n2gk+ : apply single korean mapping : {sentence}")
-        sentence = self.convert_history_event(sentence)
-        #print(f"n2gk+ : convert_history_event : {sentence}")
-        sentence = super().__call__(sentence)
-        #print(f"n2gk+ : call N2gk : {sentence}")
-        sentence = self.apply_word_mapping(sentence)
-        #print(f"n2gk+ : apply_word_mapping : {sentence}")
-        return sentence
+    def stages(self) -> list[tuple[str, Callable[[str], str]]]:
+        return [
+            ("remove_symbols", self.remove_symbols),
+            ("apply_special_symbol_mapping", self.apply_special_symbol_mapping),
+            ("apply_single_korean_mapping", self.apply_single_korean_mapping),
+            ("convert_history_event", self.convert_history_event),
+            *super().stages(),
+            ("apply_word_mapping", self.apply_word_mapping),
+        ]
 
     def run_n2gkplus(
             self,
@@ -747,6 +802,8 @@ class N2gkPlus(N2gk):
         """
         Reads JSONL, normalizes each record['text'], adds 'N2gkPlus' field with normalized text,
         and writes to output JSONL.
+        In trace mode, traced records also get an 'N2gkPlusTrace' field and a per-stage
+        time/hit report is printed at the end.
         """
         input_path = Path(input_jsonl_path)
         output_path = Path(output_jsonl_path)
@@ -757,7 +814,11 @@ class N2gkPlus(N2gk):
                 continue
             data = json.loads(line)
             text = data.get('text', '')
+            traced_before = self.trace.traced if self.trace is not None else 0
             data['N2gkPlus'] = self(text)
+            if self.trace is not None and self.trace.traced > traced_before:
+                # Stages that changed this sentence, with their cost in microseconds
+                data['N2gkPlusTrace'] = {stage: round(sec * 1e6, 1) for stage, sec in self.trace.last_changed}
             records.append(data)
 
         with output_path.open('w', encoding='utf-8') as outf:
@@ -766,3 +827,5 @@ class N2gkPlus(N2gk):
                 outf.write('\n')
 
         print(f"N2gkPlus-normalized output saved to: {output_path}")
+        if self.trace is not None:
+            print(self.trace.report("N2gkPlus stage trace"))
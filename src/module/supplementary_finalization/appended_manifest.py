@@ -0,0 +1,103 @@
+import json
+import os
+from pathlib import Path
+import numpy as np
+from pydub import AudioSegment
+
+from module.supplementary_finalization.crossfade_concatenating import CrossfadeConcatenator, PcmAudio, load_audio
+
+
+class AppendedManifestDataset:
+    """
+    Map-style dataset over a manifest written by DataAppender.run_manifest. Every item is
+    an appended utterance rendered on demand from its source clips, with the crossfades
+    (and samples) of the WAV run_appending would have written, so balanced-duration data
+    needs no rendered audio on disk.
+
+    Only the byte offsets of the manifest lines are kept in memory and every process reads
+    lines through its own file object, so the dataset can be handed to a PyTorch DataLoader
+    with worker processes as is (batching variable-length audio needs a collate_fn).
+    """
+    def __init__(self, manifest_jsonl: str, engine: str = "numpy", as_float: bool = True):
+        """
+        engine: crossfade engine of CrossfadeConcatenator ("numpy" or "pydub").
+        as_float: items carry float32 audio in [-1, 1) instead of integer PCM samples.
+        """
+        self._file = None
+        self._file_pid = None
+        self.manifest_path = Path(manifest_jsonl)
+        self.engine = engine
+        self.as_float = as_float
+        offsets = [0]
+        with self.manifest_path.open("rb") as f:
+            for line in f:
+                offsets.append(offsets[-1] + len(line))
+        self.line_offsets = np.asarray(offsets, dtype=np.int64)
+
+    def __len__(self) -> int:
+        return len(self.line_offsets) - 1
+
+    def read_row(self, i: int) -> dict:
+        """
+        Returns the manifest line of item i.
+        """
+        # A forked worker must not share the parent's file position, so it opens its own file
+        if self._file is None or self._file_pid != os.getpid():
+            self._file = self.manifest_path.open("rb")
+            self._file_pid = os.getpid()
+        start, end = int(self.line_offsets[i]), int(self.line_offsets[i + 1])
+        self._file.seek(start)
+        return json.loads(self._file.read(end - start))
+
+    def render_row(self, row: dict) -> "PcmAudio | AudioSegment":
+        concatenator = CrossfadeConcatenator(fade_ms=row["fade_ms"], crossfade_ms=row["crossfade_ms"],
+                                             engine=self.engine)
+        base_dir = self.manifest_path.parent
+        return concatenator.concatenate([load_audio(base_dir / source["path"]) for source in row["sources"]])
+
+    def render(self, i: int) -> "PcmAudio | AudioSegment":
+        """
+        Renders item i; export(path, format="wav") on the result writes the WAV
+        run_appending would have written.
+        """
+        return self.render_row(self.read_row(i))
+
+    def __getitem__(self, i: int) -> dict:
+        """
+        Returns the metadata of item i with "audio" of shape (channels, frames) and
+        "sample_rate".
+        """
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(f"Item {i} out of range for {len(self)} utterances")
+        row = self.read_row(i)
+        audio = self.render_row(row)
+        if isinstance(audio, PcmAudio):
+            samples = audio.samples
+        else:
+            samples = np.array(audio.get_array_of_samples()).reshape(-1, audio.channels)
+        samples = np.ascontiguousarray(samples.T)
+        if self.as_float:
+            samples = samples.astype(np.float32) / float(1 << (8 * audio.sample_width - 1))
+        item = {k: v for k, v in row.items() if k not in ("sources", "fade_ms", "crossfade_ms")}
+        item["audio"] = samples
+        item["sample_rate"] = audio.frame_rate
+        return item
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            self._file_pid = None
+
+    def __getstate__(self):
+        # Worker processes started by pickling open their own file
+        state = self.__dict__.copy()
+        state["_file"] = None
+        state["_file_pid"] = None
+        return state
+
+    def __del__(self):
+        if getattr(self, "_file", None) is not None:
+            self.close()
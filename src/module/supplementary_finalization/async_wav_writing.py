@@ -0,0 +1,97 @@
+import concurrent.futures
+import queue
+import threading
+
+
+class AsyncWavWriter:
+    """
+    Exports finished audio (PcmAudio or AudioSegment) as WAV files on a few writer threads,
+    so disk writes overlap with decoding and crossfading the next group.
+
+    submit() blocks once max_pending outputs are waiting, which bounds memory, and returns
+    a Future that completes when the file is written. The first write error stops the
+    remaining writes and is raised again by the next submit(), flush() or close(). Use as
+    a context manager: leaving the block flushes everything queued and raises any write
+    error.
+    """
+    def __init__(self, num_threads: int = 2, max_pending: int = 8):
+        if num_threads < 1:
+            raise ValueError("AsyncWavWriter needs at least one writer thread")
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.error = None
+        self.error_path = None
+        self.num_written = 0
+        self._lock = threading.Lock()
+        self._threads = [
+            threading.Thread(target=self._run, name=f"wav-writer-{i}", daemon=True)
+            for i in range(num_threads)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def _run(self) -> None:
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    return
+                audio, path, future = item
+                if self.error is not None:
+                    future.cancel()  # drop the rest after a failure
+                    continue
+                try:
+                    audio.export(path, format="wav")
+                except BaseException as e:
+                    with self._lock:
+                        if self.error is None:
+                            self.error, self.error_path = e, path
+                    future.set_exception(e)
+                else:
+                    with self._lock:
+                        self.num_written += 1
+                    future.set_result(path)
+            finally:
+                self.queue.task_done()
+
+    def _raise_error(self) -> None:
+        if self.error is not None:
+            print(f"Error: failed to write {self.error_path}")
+            raise self.error
+
+    def submit(self, audio, path: str) -> concurrent.futures.Future:
+        """
+        Queues audio to be written to path, waiting while max_pending outputs are queued.
+        """
+        self._raise_error()
+        if not any(thread.is_alive() for thread in self._threads):
+            raise RuntimeError("AsyncWavWriter is closed")
+        future = concurrent.futures.Future()
+        self.queue.put((audio, path, future))
+        return future
+
+    def flush(self) -> None:
+        """
+        Waits until every queued output is written.
+        """
+        self.queue.join()
+        self._raise_error()
+
+    def close(self, raise_errors: bool = True) -> None:
+        """
+        Writes everything queued and stops the threads.
+        """
+        if any(thread.is_alive() for thread in self._threads):
+            self.queue.join()
+            for _ in self._threads:
+                self.queue.put(None)
+            for thread in self._threads:
+                thread.join()
+        if raise_errors:
+            self._raise_error()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # Do not mask an exception of the block with a write error
+        self.close(raise_errors=exc_type is None)
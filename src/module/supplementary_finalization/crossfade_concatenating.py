@@ -0,0 +1,338 @@
+import contextlib
+import wave
+import numpy as np
+from pydub import AudioSegment
+from pydub.exceptions import TooManyMissingFrames
+from pydub.utils import db_to_float
+
+# pydub sample widths handled as arrays (little-endian signed PCM, like AudioSegment.raw_data)
+SAMPLE_DTYPES = {2: np.dtype("<i2"), 4: np.dtype("<i4")}
+
+
+def load_audio(path: str) -> AudioSegment:
+    """
+    Decodes an MP3 or WAV source clip with pydub.
+    """
+    if str(path).endswith('.mp3'):
+        return AudioSegment.from_mp3(path)
+    return AudioSegment.from_wav(path)
+
+
+class PcmAudio:
+    """
+    Decoded PCM audio as an array of shape (frames, channels), in the sample format of
+    pydub's AudioSegment.raw_data. len() and export() behave like AudioSegment's.
+    """
+    def __init__(self, samples: np.ndarray, frame_rate: int, sample_width: int):
+        self.samples = samples
+        self.frame_rate = frame_rate
+        self.sample_width = sample_width
+
+    @property
+    def channels(self) -> int:
+        return self.samples.shape[1]
+
+    @property
+    def num_frames(self) -> int:
+        return len(self.samples)
+
+    def __len__(self) -> int:
+        # Milliseconds, rounded like AudioSegment.__len__
+        return _ms_len(self.num_frames, self.frame_rate)
+
+    @classmethod
+    def from_segment(cls, segment: AudioSegment) -> "PcmAudio | None":
+        """
+        Wraps the raw data of an AudioSegment without copying it, or returns None when its
+        sample width has no array engine.
+        """
+        dtype = SAMPLE_DTYPES.get(segment.sample_width)
+        raw = segment.raw_data
+        if dtype is None or len(raw) % segment.frame_width:
+            return None
+        samples = np.frombuffer(raw, dtype=dtype).reshape(-1, segment.channels)
+        return cls(samples, segment.frame_rate, segment.sample_width)
+
+    def to_segment(self) -> AudioSegment:
+        return AudioSegment(data=self.samples.tobytes(), sample_width=self.sample_width,
+                            frame_rate=self.frame_rate, channels=self.channels)
+
+    def export(self, out_f, format: str = "wav") -> None:
+        """
+        Writes the audio as a WAV file in one call, with the same header and data as
+        AudioSegment.export(out_f, format="wav").
+        """
+        if format != "wav":
+            raise ValueError(f"PcmAudio can only be exported as wav, not {format}")
+        samples = np.ascontiguousarray(self.samples)
+        with contextlib.ExitStack() as stack:
+            f = out_f if hasattr(out_f, "write") else stack.enter_context(open(out_f, "wb"))
+            with wave.open(f, "wb") as w:
+                w.setnchannels(self.channels)
+                w.setsampwidth(self.sample_width)
+                w.setframerate(self.frame_rate)
+                w.setnframes(self.num_frames)
+                w.writeframesraw(samples)
+
+
+class CrossfadeConcatenator:
+    """
+    Joins the clips of one appended utterance the way DataAppender always has with pydub:
+
+        combined = combined.fade_out(fade_ms).append(clip.fade_in(fade_ms))
+
+    i.e. a fade out / fade in at every junction and pydub's default 100 ms overlap.
+    The "numpy" engine reproduces pydub sample for sample (its millisecond rounding,
+    gain steps and integer truncation) on a preallocated array: only the last fade_ms of
+    the output and the head of the next clip are touched at every junction, instead of
+    copying the whole growing AudioSegment several times per clip. Clips of mixed
+    formats (which pydub resamples) or without an array sample width are joined with
+    pydub instead.
+    """
+    def __init__(self, fade_ms: int = 500, crossfade_ms: int = 100, engine: str = "numpy"):
+        if engine not in ("numpy", "pydub"):
+            raise ValueError(f"Unknown crossfade engine: {engine}")
+        self.fade_ms = fade_ms
+        self.crossfade_ms = crossfade_ms
+        self.engine = engine
+
+    def concatenate(self, segments: list[AudioSegment]) -> "PcmAudio | AudioSegment":
+        """
+        Returns the joined audio (a PcmAudio, or an AudioSegment from the pydub engine).
+        """
+        if self.engine == "numpy":
+            clips = [PcmAudio.from_segment(s) for s in segments]
+            formats = {(c.frame_rate, c.channels, c.sample_width) for c in clips if c is not None}
+            if clips and None not in clips and len(formats) == 1:
+                return self.concatenate_pcm(clips)
+        return self.concatenate_pydub(segments)
+
+    def concatenate_pydub(self, segments: list[AudioSegment]) -> AudioSegment:
+        combined = AudioSegment.empty()
+        for wav in segments:
+            if len(combined) > 0:
+                combined = combined.fade_out(self.fade_ms).append(wav.fade_in(self.fade_ms), crossfade=self.crossfade_ms)
+            else:
+                combined += wav
+        return combined
+
+    def concatenate_pcm(self, clips: list[PcmAudio]) -> PcmAudio:
+        """
+        Joins clips of one format into a buffer sized from their lengths, in place.
+        """
+        rate, width = clips[0].frame_rate, clips[0].sample_width
+        # Crossfades only shorten the output; the slack covers pydub's silence padding
+        capacity = sum(c.num_frames for c in clips) + len(clips) * (rate // 100 + 1)
+        out = np.empty((capacity, clips[0].channels), dtype=clips[0].samples.dtype)
+        n = 0
+        for clip in clips:
+            if _ms_len(n, rate) > 0:
+                k, tail = _fade(out[:n], rate, width, to_gain=-120, duration=self.fade_ms, end=float("inf"))
+                out, n = _write(out, k, tail)
+                k, tail = _fade(clip.samples, rate, width, from_gain=-120, duration=self.fade_ms, start=0)
+                faded = np.concatenate([clip.samples[:k], tail]) if k else tail
+                k, tail = _append(out[:n], faded, rate, width, self.crossfade_ms)
+                out, n = _write(out, k, tail)
+            else:
+                out, n = _write(out, n, clip.samples)
+        return PcmAudio(out[:n], rate, width)
+
+
+# ─── pydub operations on (frames, channels) arrays ────────────────────────────
+# Each mirrors the AudioSegment method of the same name, including its rounding.
+# Operations that keep a prefix of their input return (prefix length, new tail).
+
+def _ms_len(num_frames: int, rate: int) -> int:
+    return round(1000 * (float(num_frames) / rate))
+
+
+def _frame_pos(ms, length_ms: int, rate: int) -> int:
+    if ms < 0:
+        ms = length_ms - abs(ms)
+    if ms == float("inf"):
+        return int(length_ms * (rate / 1000.0))
+    return int(ms * (rate / 1000.0))
+
+
+def _slice(x: np.ndarray, start, end, rate: int, clamp: bool = True) -> tuple[np.ndarray, int]:
+    """
+    AudioSegment.__getitem__: x[start ms:end ms] (clamp=True) or x[start ms] (clamp=False,
+    end = start + 1). Returns (frames, number of silent frames pydub pads them with).
+    """
+    length = _ms_len(len(x), rate)
+    if clamp:
+        start, end = min(start, length), min(end, length)
+    s, e = _frame_pos(start, length, rate), _frame_pos(end, length, rate)
+    data = x[s:e]
+    missing = (e - s) - len(data)
+    if missing > 0 and len(data):
+        if missing > 2 * (rate / 1000.0):
+            raise TooManyMissingFrames(f"You should never be filling in more than 2 ms with silence here, "
+                                       f"missing frames: {missing}")
+        return data, missing
+    return data, 0
+
+
+def _padded(data: np.ndarray, pad: int) -> np.ndarray:
+    if not pad:
+        return data
+    return np.concatenate([data, np.zeros((pad, data.shape[1]), dtype=data.dtype)])
+
+
+def _mul(x: np.ndarray, factor, width: int) -> np.ndarray:
+    """
+    audioop.mul: scales and floors every sample, saturating at the sample range.
+    factor is a scalar or one factor per frame.
+    """
+    if not len(x):
+        return x
+    factor = np.asarray(factor, dtype=np.float64)
+    if factor.ndim:
+        factor = factor[:, None]
+    info = np.iinfo(SAMPLE_DTYPES[width])
+    y = np.floor(x.astype(np.float64) * factor)
+    return np.clip(y, info.min, info.max).astype(x.dtype)
+
+
+def _add(a: np.ndarray, b: np.ndarray, width: int) -> np.ndarray:
+    info = np.iinfo(SAMPLE_DTYPES[width])
+    return np.clip(a.astype(np.int64) + b, info.min, info.max).astype(a.dtype)
+
+
+def _fade(x: np.ndarray, rate: int, width: int, to_gain: float = 0, from_gain: float = 0,
+          start=None, end=None, duration=None) -> tuple[int, np.ndarray]:
+    """
+    AudioSegment.fade; the result is x[:k] followed by the returned tail.
+    """
+    length = _ms_len(len(x), rate)
+    start = min(length, start) if start is not None else None
+    end = min(length, end) if end is not None else None
+    if start is not None and start < 0:
+        start += length
+    if end is not None and end < 0:
+        end += length
+    if duration:
+        if start is not None:
+            end = start + duration
+        elif end is not None:
+            start = end - duration
+    else:
+        duration = end - start
+
+    from_power = db_to_float(from_gain)
+    parts = []
+    before, pad = _slice(x, 0, start, rate)
+    if from_gain != 0:
+        k = 0
+        parts.append(_mul(_padded(before, pad), from_power, width))
+    else:
+        # Untouched prefix of x (pydub's slice is a prefix, padded with silence at most)
+        k = len(before)
+        if pad:
+            parts.append(np.zeros((pad, x.shape[1]), dtype=x.dtype))
+
+    gain_delta = db_to_float(to_gain) - from_power
+    if duration > 100:
+        # One gain step per millisecond
+        scale_step = gain_delta / duration
+        volumes = from_power + scale_step * np.arange(duration, dtype=np.float64)
+        ms = start + np.arange(duration + 1, dtype=np.int64)
+        ms = np.where(ms < 0, length - np.abs(ms), ms)
+        pos = (ms * (rate / 1000.0)).astype(np.int64)
+        if duration and pos[0] >= 0 and pos[-1] <= len(x) and np.all(np.diff(pos) >= 0):
+            parts.append(_mul(x[pos[0]:pos[-1]], np.repeat(volumes, np.diff(pos)), width))
+        else:
+            for i in range(duration):
+                chunk, chunk_pad = _slice(x, start + i, start + i + 1, rate, clamp=False)
+                parts.append(_mul(_padded(chunk, chunk_pad), volumes[i], width))
+    else:
+        # One gain step per frame
+        start_frame = start * (rate / 1000.0)
+        end_frame = end * (rate / 1000.0)
+        fade_frames = end_frame - start_frame
+        scale_step = gain_delta / fade_frames
+        steps = np.arange(int(fade_frames), dtype=np.float64)
+        volumes = from_power + scale_step * steps
+        idx = (start_frame + steps).astype(np.int64)
+        if not len(idx) or idx[0] >= 0:
+            keep = idx < len(x)
+            parts.append(_mul(x[idx[keep]], volumes[keep], width))
+        else:
+            for i, frame in enumerate(idx.tolist()):
+                parts.append(_mul(x[frame:frame + 1], volumes[i], width))
+
+    after, pad = _slice(x, end, length, rate)
+    after = _padded(after, pad)
+    if to_gain != 0:
+        after = _mul(after, db_to_float(to_gain), width)
+    parts.append(after)
+    return k, np.concatenate(parts)
+
+
+def _faded(x: np.ndarray, rate: int, width: int, **kwargs) -> np.ndarray:
+    k, tail = _fade(x, rate, width, **kwargs)
+    return np.concatenate([x[:k], tail]) if k else tail
+
+
+def _overlay_loop(a: np.ndarray, b: np.ndarray, rate: int, width: int) -> np.ndarray:
+    """
+    a * b for AudioSegments: b overlaid on a from its start, looped over a's length.
+    """
+    seg1, pad = _slice(a, 0, _ms_len(len(a), rate), rate)
+    seg1 = _padded(seg1, pad)
+    seg2 = b
+    parts = []
+    pos = 0
+    times = -1
+    while times:
+        remaining = max(0, len(seg1) - pos)
+        if len(seg2) >= remaining:
+            seg2 = seg2[:remaining]
+            times = 1
+        elif not len(seg2):
+            raise ValueError("Cannot loop an empty segment over audio")
+        parts.append(_add(seg1[pos:pos + len(seg2)], seg2, width))
+        pos += len(seg2)
+        times -= 1
+    parts.append(seg1[pos:])
+    return np.concatenate(parts)
+
+
+def _append(x: np.ndarray, y: np.ndarray, rate: int, width: int, crossfade: int) -> tuple[int, np.ndarray]:
+    """
+    AudioSegment.append for segments of one format; the result is x[:k] followed by
+    the returned tail.
+    """
+    if not crossfade:
+        return len(x), y
+    len_x, len_y = _ms_len(len(x), rate), _ms_len(len(y), rate)
+    if crossfade > len_x:
+        raise ValueError(f"Crossfade is longer than the original AudioSegment ({crossfade}ms > {len_x}ms)")
+    if crossfade > len_y:
+        raise ValueError(f"Crossfade is longer than the appended AudioSegment ({crossfade}ms > {len_y}ms)")
+
+    xa, pad = _slice(x, -crossfade, len_x, rate)
+    xa = _faded(_padded(xa, pad), rate, width, to_gain=-120, start=0, end=float("inf"))
+    xb, pad = _slice(y, 0, crossfade, rate)
+    xb = _faded(_padded(xb, pad), rate, width, from_gain=-120, start=0, end=float("inf"))
+    xf = _overlay_loop(xa, xb, rate, width)
+
+    head, head_pad = _slice(x, 0, -crossfade, rate)
+    rest, pad = _slice(y, crossfade, len_y, rate)
+    parts = [xf, _padded(rest, pad)]
+    if head_pad:
+        parts.insert(0, np.zeros((head_pad, x.shape[1]), dtype=x.dtype))
+    return len(head), np.concatenate(parts)
+
+
+def _write(out: np.ndarray, k: int, tail: np.ndarray) -> tuple[np.ndarray, int]:
+    """
+    Replaces out[k:] with tail, growing the buffer if needed. Returns (buffer, length).
+    """
+    n = k + len(tail)
+    if n > len(out):
+        grown = np.empty((max(n, 2 * len(out)), out.shape[1]), dtype=out.dtype)
+        grown[:k] = out[:k]
+        out = grown
+    out[k:n] = tail
+    return out, n
@@ -1,18 +1,163 @@
+import collections
+import concurrent.futures
+import contextlib
+import hashlib
 import random
 import json
+from collections.abc import Sequence
 from pathlib import Path
-from pydub import AudioSegment
 from tqdm import tqdm
 import os
 
+from module.supplementary_finalization.async_wav_writing import AsyncWavWriter
+from module.supplementary_finalization.crossfade_concatenating import CrossfadeConcatenator, load_audio
+
+
+class ClipPool(Sequence):
+    """
+    The remaining clips of a speaker, as integer IDs 0..n-1 into the speaker's list.
+
+    pool[k] is the ID of the k-th remaining clip in the original order, so
+    random.sample(pool, k) draws exactly what it would from the list of remaining
+    clips. A Fenwick tree over alive flags gives removal by ID and indexing in
+    O(log n); removing by swapping with the last slot would be O(1) but would
+    reorder the pool and change the samples drawn for a given seed.
+    """
+    def __init__(self, n: int):
+        self.n = n
+        self.size = n
+        self.alive = bytearray(b"\x01") * n
+        # tree[i] counts alive IDs in (i - lowbit(i), i], 1-based
+        self.tree = [0] * (n + 1)
+        for i in range(1, n + 1):
+            self.tree[i] += 1
+            parent = i + (i & -i)
+            if parent <= n:
+                self.tree[parent] += self.tree[i]
+        self.top_bit = 1 << (n.bit_length() - 1) if n else 0
+        # IDs in order, kept between removals (random.sample copies pools of <= 21 clips)
+        self._ids = None
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __getitem__(self, k: int) -> int:
+        if k < 0:
+            k += self.size
+        if not 0 <= k < self.size:
+            raise IndexError("ClipPool index out of range")
+        # Descend to the largest position whose prefix count is <= k
+        pos = 0
+        bit = self.top_bit
+        tree = self.tree
+        while bit:
+            nxt = pos + bit
+            if nxt <= self.n and tree[nxt] <= k:
+                pos = nxt
+                k -= tree[nxt]
+            bit >>= 1
+        return pos
+
+    def __iter__(self):
+        if self._ids is None:
+            self._ids = [self[k] for k in range(self.size)]
+        return iter(self._ids)
+
+    def __contains__(self, clip_id) -> bool:
+        return 0 <= clip_id < self.n and bool(self.alive[clip_id])
+
+    def remove(self, clip_id: int) -> None:
+        """
+        Removes clip_id from the pool; removing a clip that is already gone is a no-op.
+        """
+        if not self.alive[clip_id]:
+            return
+        self.alive[clip_id] = 0
+        self.size -= 1
+        self._ids = None
+        i = clip_id + 1
+        while i <= self.n:
+            self.tree[i] -= 1
+            i += i & -i
+
+
+class MetadataWriter:
+    """
+    Appends the metadata rows of run_appending to its output JSONL as their WAVs are
+    written. Every row is flushed and the file is fsync-ed every fsync_every rows and on
+    close, so an interrupted run keeps the metadata of what it wrote. With truncate_at,
+    an existing file is cut there and appended to (see DataAppender.find_resume_point).
+    """
+    def __init__(self, path: str, truncate_at: int | None = None, fsync_every: int = 256):
+        self.path = Path(path)
+        self.fsync_every = fsync_every
+        self.num_rows = 0
+        self._unsynced = 0
+        if truncate_at is not None and self.path.exists():
+            self.f = self.path.open("r+b")
+            self.f.truncate(truncate_at)
+            self.f.seek(truncate_at)
+        else:
+            self.f = self.path.open("wb")
+
+    def write(self, row: dict) -> None:
+        self.f.write((json.dumps(row, ensure_ascii=False) + "\n").encode("utf-8"))
+        self.f.flush()
+        self.num_rows += 1
+        self._unsynced += 1
+        if self._unsynced >= self.fsync_every:
+            self.sync()
+
+    def sync(self) -> None:
+        self.f.flush()
+        os.fsync(self.f.fileno())
+        self._unsynced = 0
+
+    def close(self) -> None:
+        if not self.f.closed:
+            self.sync()
+            self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
 class DataAppender:
     """
     Combines audio segments per speaker under a max duration,
     exports augmented WAVs, and writes metadata JSONL.
     """
-    def __init__(self, max_total_duration: int = 30, random_seed: int = 74):
+    def __init__(
+        self,
+        max_total_duration: int = 30,
+        random_seed: int = 74,
+        crossfade_engine: str = "numpy",
+        round_size: int | None = None,
+        num_workers: int = 1,
+        writer_threads: int = 2,
+    ):
+        """
+        crossfade_engine: "numpy" joins clips in a preallocated array, "pydub" with AudioSegment
+            (identical output; see CrossfadeConcatenator).
+        round_size: None plans speakers one after another from a single random stream.
+            Otherwise speakers are appended in rounds of round_size with per-speaker seeds
+            (see append_by_rounds), which num_workers processes can share.
+        num_workers: processes of the round mode; the output does not depend on it.
+        writer_threads: threads writing finished WAVs in the background (AsyncWavWriter);
+            0 writes them synchronously.
+        """
+        if num_workers > 1 and round_size is None:
+            raise ValueError("num_workers > 1 needs a round_size (speakers per round)")
         self.max_total_duration = max_total_duration  # seconds
         self.random_seed = random_seed
+        self.crossfade_engine = crossfade_engine
+        self.round_size = round_size
+        self.num_workers = num_workers
+        self.writer_threads = writer_threads
+        self.concatenator = CrossfadeConcatenator(fade_ms=500, engine=crossfade_engine)
 
     @staticmethod
     def calculate_weights(
@@ -27,13 +172,14 @@ class DataAppender:
         """
         n_total = sum(n_bucket.values()) or 1
         m_total = sum(m_bucket.values()) or 1
-        n_w = {i: (n_total - n_bucket[i]) / n_total for i in range(30)}
-        m_w = {i: (m_total - m_bucket[i]) / m_total for i in range(30)}
-        weights: dict[int, float] = {}
-        for i in range(30):
-            w = n_w[i] * (1- 1/(total_speakers+epsilon)) + m_w[i] * (1/(total_speakers+epsilon))
-            weights[i] = w if w > 0 else 1.0
-        gamma = {i: weights[min(i*(30//m_gamma_low), 29)] for i in range(1, m_gamma_low+1)}
+        speaker_share = 1/(total_speakers+epsilon)
+        step = 30//m_gamma_low
+        # Only the buckets gamma reads are weighted
+        gamma: dict[int, float] = {}
+        for i in range(1, m_gamma_low+1):
+            b = min(i*step, 29)
+            w = (n_total - n_bucket[b]) / n_total * (1- speaker_share) + (m_total - m_bucket[b]) / m_total * speaker_share
+            gamma[i] = w if w > 0 else 1.0
         return gamma
 
     def load_data(self, input_jsonl_path: str) -> dict[str, list[dict]]:
@@ -49,9 +195,7 @@ class DataAppender:
                 if dur >= self.max_total_duration:
                     continue
                 wav_rel = Path(entry['wav'])
-                print(f"wav_rel: {wav_rel}")
                 full_wav = base_dir / wav_rel
-                print(f"full_wav: {full_wav}")
                 if "emilia" in str(full_wav):
                     last_folder = str(wav_rel).split("/")[-1]
                     parts = last_folder.split("_")
@@ -78,144 +222,392 @@ class DataAppender:
         return speaker_data
     
 
-    def run_appending(self, input_jsonl_path: str, output_jsonl_path: str) -> None:
+    def plan_speaker(
+        self,
+        group_key: str,
+        wav_data_list: list[dict],
+        wav_dir: Path,
+        n_bucket: dict[int, int],
+        total_speakers: int,
+        rng: random.Random,
+    ) -> list[dict]:
+        """
+        Chooses the appended groups of one speaker from metadata only (durations, and
+        whether each file exists), updating n_bucket. Returns one entry per output WAV:
+        {"output_path", "sources": source audio paths in order, "source_durations",
+        "row": its JSONL line}.
+        """
+        groups = []
+        pool = ClipPool(len(wav_data_list))
+        m_bucket = {i: 0 for i in range(30)}
+        m_threshold = len(wav_data_list) // 465 + 1
+        back_count = 0
+        file_index = 1
+        exists = [None] * len(wav_data_list)
+
+        current_speaker_total_duration = sum(w['duration'] for w in wav_data_list)
+        m = current_speaker_total_duration / len(wav_data_list)
+        m_gamma = 30 / m
+        m_gamma_low = int(m_gamma)
+
+        while pool:
+            weights = self.calculate_weights(n_bucket, m_bucket, total_speakers, m_gamma_low)
+            num_selected = rng.choices(range(1, m_gamma_low + 1), weights=weights.values(), k=1)[0]
+            num_selected = min(num_selected, len(pool))
+            selected_ids = rng.sample(pool, num_selected)
+            selected_files = [wav_data_list[i] for i in selected_ids]
+            selected_durations = sum(d['duration'] for d in selected_files)
+
+            if selected_durations >= self.max_total_duration:
+                continue
+
+            current_text = ""
+            current_sr = ""
+            current_n2gkplus = ""
+            valid_files = []
+            valid_ids = []
+            for clip_id, data in zip(selected_ids, selected_files):
+                if exists[clip_id] is None:
+                    exists[clip_id] = os.path.exists(data['wav'])
+                    if not exists[clip_id]:
+                        print(f"Warning: File not found: {data['wav']}")
+                if not exists[clip_id]:
+                    continue
+                current_text += " " + data['text']
+                current_sr += " " + data['sr'] if data['sr'] is not None else ""
+                current_n2gkplus += " " + data['N2gkPlus']
+                valid_files.append(data)
+                valid_ids.append(clip_id)
+
+            if not valid_files:
+                for i in selected_ids:
+                    pool.remove(i)
+                continue
+
+            bucket = int(selected_durations)
+            n_bucket[bucket] += 1
+            m_bucket[bucket] += 1
+
+            if back_count < 5 and m_bucket[bucket] + 1 > m_threshold:
+                back_count += 1
+                continue
+            else:
+                back_count = 0
+
+            for i in valid_ids:
+                pool.remove(i)
+
+            output_path = os.path.join(wav_dir / group_key, f"{file_index:06d}.wav")
+            groups.append({
+                "output_path": output_path,
+                "sources": [str(data['wav']) for data in valid_files],
+                "source_durations": [data['duration'] for data in valid_files],
+                "row": {
+                    "wav": output_path.replace('../data/',''),
+                    "duration": selected_durations,
+                    "text": current_text.strip(),
+                    "sr": current_sr.strip(),
+                    "N2gkPlus": current_n2gkplus.strip(),
+                    "speaker": group_key
+                },
+            })
+            file_index += 1
+        return groups
+
+    def plan_appending(self, speaker_data: dict[str, list[dict]], wav_dir: Path) -> tuple[list[dict], dict[int, int]]:
+        """
+        Plans every speaker in order without decoding any audio. Rejected candidates cost
+        only their durations, so a whole corpus plans in seconds; the plan is deterministic
+        for a given random_seed. Returns (groups of plan_speaker, n_bucket).
+        """
+        n_bucket = {i: 0 for i in range(30)}
+        total_speakers = len(speaker_data)
+        rng = random.Random(self.random_seed)
+        plan = []
+        for group_key, wav_data_list in tqdm(speaker_data.items(), desc="Planning speakers", unit="speaker"):
+            plan.extend(self.plan_speaker(group_key, wav_data_list, wav_dir, n_bucket, total_speakers, rng))
+            total_speakers -= 1
+        print(f"Planned {len(plan)} appended files from {len(speaker_data)} speakers")
+        return plan, n_bucket
 
-        jsonl_buffer = []  # Buffer
-        file_counter = {}
+    @staticmethod
+    def speaker_seed(random_seed: int, group_key: str) -> int:
+        """
+        Seed of a speaker in the round mode, stable across runs and processes.
+        """
+        digest = hashlib.blake2b(f"{random_seed}:{group_key}".encode("utf-8"), digest_size=8).digest()
+        return int.from_bytes(digest, "little")
+
+    def append_speaker(
+        self,
+        group_key: str,
+        wav_data_list: list[dict],
+        wav_dir: Path,
+        n_bucket: dict[int, int],
+        total_speakers: int,
+        render: bool = True,
+    ) -> tuple[list[dict], dict[int, int]]:
+        """
+        Plans (and renders, if render) one speaker of the round mode, from its own seed and
+        a copy of n_bucket. Returns (groups, the bucket counts it added).
+        """
+        snapshot = dict(n_bucket)
+        rng = random.Random(self.speaker_seed(self.random_seed, group_key))
+        groups = self.plan_speaker(group_key, wav_data_list, wav_dir, snapshot, total_speakers, rng)
+        if render:
+            with self.open_writer() as writer:
+                for group in groups:
+                    self.render_group(group, writer)
+        return groups, {i: snapshot[i] - n_bucket[i] for i in range(30)}
+
+    def append_by_rounds(
+        self,
+        speaker_data: dict[str, list[dict]],
+        wav_dir: Path,
+        render: bool = True,
+        completed: dict[str, int] | None = None,
+        meta: MetadataWriter | None = None,
+    ) -> tuple[list[dict], dict[int, int]]:
+        """
+        Round mode of plan_appending. The sequential plan threads n_bucket and one random
+        stream through every speaker; here the speakers of a round of round_size all start
+        from the n_bucket of the end of the previous round, with total_speakers the number
+        of speakers left at their position, and draw from speaker_seed. Speakers of a round
+        are independent, so they are planned (and rendered) on num_workers processes, and
+        the output depends only on random_seed and round_size. Balancing lags by at most
+        one round, so the duration histogram stays close to the sequential one.
+
+        Speakers in completed (rows per speaker already written, when resuming) are planned
+        again, for the state they pass on, but not rendered. The rows of every other
+        speaker are written to meta as soon as its WAVs are. Returns (groups in speaker
+        order, n_bucket).
+        """
+        completed = completed or {}
         n_bucket = {i: 0 for i in range(30)}
+        items = list(speaker_data.items())
+        plan = []
+        executor = None
+        if self.num_workers > 1:
+            executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=self.num_workers, initializer=_init_appender_worker,
+                initargs=(self.max_total_duration, self.random_seed, self.crossfade_engine, self.writer_threads)
+            )
+        try:
+            with tqdm(total=len(items), desc="Appending speakers", unit="speaker") as pbar:
+                for round_start in range(0, len(items), self.round_size):
+                    snapshot = dict(n_bucket)
+                    tasks = [
+                        (group_key, wav_data_list, wav_dir, snapshot, len(items) - (round_start + j),
+                         render and group_key not in completed)
+                        for j, (group_key, wav_data_list) in enumerate(items[round_start:round_start + self.round_size])
+                    ]
+                    if executor is None:
+                        results = (self.append_speaker(*task) for task in tasks)
+                    else:
+                        results = (future.result() for future in
+                                   [executor.submit(_append_speaker_in_worker, task) for task in tasks])
+                    for task, (groups, added) in zip(tasks, results):
+                        group_key = task[0]
+                        if group_key in completed:
+                            self.check_resumed_speaker(group_key, len(groups), completed)
+                        elif meta is not None:
+                            for group in groups:
+                                meta.write(group["row"])
+                        plan.extend(groups)
+                        for i in range(30):
+                            n_bucket[i] += added[i]
+                        pbar.update(1)
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+        print(f"Planned {len(plan)} appended files from {len(items)} speakers "
+              f"(rounds of {self.round_size}, {self.num_workers} worker(s))")
+        return plan, n_bucket
+
+    def open_writer(self) -> "AsyncWavWriter | contextlib.nullcontext":
+        """
+        Background WAV writer for render_group, or a no-op context (synchronous writes)
+        when writer_threads is 0.
+        """
+        if self.writer_threads > 0:
+            return AsyncWavWriter(num_threads=self.writer_threads, max_pending=2 * self.writer_threads)
+        return contextlib.nullcontext()
+
+    def render_group(
+        self,
+        group: dict,
+        writer: AsyncWavWriter | None = None
+    ) -> concurrent.futures.Future | None:
+        """
+        Decodes the sources of a planned group, crossfades them and writes its WAV,
+        through writer when given (returning the Future of the write).
+        """
+        segments = [load_audio(path) for path in group["sources"]]
+        os.makedirs(os.path.dirname(group["output_path"]), exist_ok=True)
+        audio = self.concatenator.concatenate(segments)
+        if writer is None:
+            audio.export(group["output_path"], format="wav")
+            return None
+        return writer.submit(audio, group["output_path"])
+
+    @staticmethod
+    def write_finished_rows(pending: collections.deque, meta: MetadataWriter, wait: bool = False) -> None:
+        """
+        Pops (write Future or None, row) pairs from the left of pending and writes their rows
+        while their WAVs are written (all of them with wait), keeping the plan order.
+        """
+        while pending and (wait or pending[0][0] is None or pending[0][0].done()):
+            future, row = pending.popleft()
+            if future is not None:
+                future.result()
+            meta.write(row)
+
+    @staticmethod
+    def find_resume_point(output_jsonl_path: str) -> tuple[dict[str, int], int]:
+        """
+        Reads the output of an interrupted run_appending. Rows are written speaker by speaker
+        in plan order, so every speaker but the last one in the file is complete; the last
+        one (possibly partial) and a torn last line are cut off and redone.
+        Returns (rows per completed speaker, byte offset to truncate the file at).
+        """
+        path = Path(output_jsonl_path)
+        if not path.exists():
+            return {}, 0
+        entries = []  # (byte offset, speaker) per row
+        offset = 0
+        with path.open("rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    speaker = json.loads(line)["speaker"]
+                except (ValueError, KeyError, TypeError):
+                    break
+                entries.append((offset, speaker))
+                offset += len(line)
+        if not entries:
+            return {}, 0
+        cut = len(entries)
+        while cut and entries[cut - 1][1] == entries[-1][1]:
+            cut -= 1
+        completed = collections.Counter(speaker for _, speaker in entries[:cut])
+        return dict(completed), entries[cut][0]
+
+    @staticmethod
+    def check_resumed_speaker(group_key: str, num_groups: int, completed: dict[str, int]) -> None:
+        if completed[group_key] != num_groups:
+            raise ValueError(f"Cannot resume: the output has {completed[group_key]} rows for speaker {group_key} "
+                             f"but the plan has {num_groups}; was it written with other settings or input?")
+
+    @staticmethod
+    def print_bucket_distribution(n_bucket: dict[int, int]) -> None:
+        # Print the number of samples aggregated for each interval (calculated as a percentage)
+        print("Sample distribution across 1~29 second buckets:")
+        total_samples_sum = sum(n_bucket.values()) or 1  # Sum of total samples
+        for i in range(0, 30):
+            percent = (n_bucket[i] / total_samples_sum) * 100  # Calculate ratio by number of samples
+            print(f"Bucket {i} seconds: {n_bucket[i]} samples ({percent:.2f}%)")
+
+    def manifest_row(self, group: dict, manifest_dir: Path) -> dict:
+        """
+        The manifest line of a planned group: its metadata with "id" (the path its WAV would
+        have, relative to the manifest) in place of "wav", the fade parameters, and its
+        sources relative to the manifest with their nominal offsets in the rendered
+        utterance (seconds, from metadata durations).
+        """
+        row = {"id": os.path.relpath(group["output_path"], manifest_dir)}
+        row.update((k, v) for k, v in group["row"].items() if k != "wav")
+        row["fade_ms"] = self.concatenator.fade_ms
+        row["crossfade_ms"] = self.concatenator.crossfade_ms
+        sources = []
+        offset = 0.0
+        for path, duration in zip(group["sources"], group["source_durations"]):
+            sources.append({"path": os.path.relpath(path, manifest_dir), "offset": round(offset, 3), "duration": duration})
+            offset += duration - self.concatenator.crossfade_ms / 1000
+        row["sources"] = sources
+        return row
+
+    def run_manifest(self, input_jsonl_path: str, manifest_jsonl_path: str) -> None:
+        """
+        Plans like run_appending but writes no audio: every appended utterance becomes a
+        manifest line (see manifest_row), rendered on demand by AppendedManifestDataset
+        with the same samples as the WAV run_appending would write.
+        """
+        manifest = Path(manifest_jsonl_path)
+        manifest.parent.mkdir(parents=True, exist_ok=True)
 
+        speaker_data = self.load_data(input_jsonl_path)
+        if self.round_size is None:
+            plan, n_bucket = self.plan_appending(speaker_data, manifest.parent / 'wavs_appended')
+        else:
+            plan, n_bucket = self.append_by_rounds(speaker_data, manifest.parent / 'wavs_appended', render=False)
+
+        with manifest.open('w', encoding='utf-8') as f:
+            for group in plan:
+                f.write(json.dumps(self.manifest_row(group, manifest.parent), ensure_ascii=False) + "\n")
+
+        self.print_bucket_distribution(n_bucket)
+        print(f"Appended manifest saved to: {manifest} ({len(plan)} utterances)")
+
+    def run_appending(
+        self,
+        input_jsonl_path: str,
+        output_jsonl_path: str,
+        resume: bool = False,
+        fsync_every: int = 256,
+    ) -> None:
+        """
+        Plans the appended groups of every speaker from metadata, then renders only the
+        accepted groups (speaker by speaker on the worker processes in the round mode).
+        Metadata rows are streamed to output_jsonl_path as their WAVs are written
+        (see MetadataWriter).
+
+        resume: continue an interrupted run with the same settings and input. Speakers
+            complete in the existing output are kept and not rendered again; the rest of
+            the file is truncated (see find_resume_point).
+        """
         output_meta = Path(output_jsonl_path)
         output_meta.parent.mkdir(parents=True, exist_ok=True)
         wav_dir = output_meta.parent / 'wavs_appended'
         wav_dir.mkdir(parents=True, exist_ok=True)
 
+        completed, truncate_at = {}, None
+        if resume:
+            completed, truncate_at = self.find_resume_point(output_meta)
+            print(f"Resuming {output_meta}: keeping {sum(completed.values())} rows of "
+                  f"{len(completed)} complete speakers")
 
         speaker_data = self.load_data(input_jsonl_path)
-        total_rows = sum(len(wavs) for wavs in speaker_data.values())
-        total_duration = sum(wav['duration'] for wavs in speaker_data.values() for wav in wavs)
-        total_speakers = len(speaker_data)
-
-        random.seed(self.random_seed)
-
-        for group_key, wav_data_list in tqdm(speaker_data.items(), desc="Processing Speakers", unit="speaker"):
-            selected_data = []
-            m_bucket = {i: 0 for i in range(30)}
-            m_threshold = len(wav_data_list) // 465 + 1
-            back_count = 0
-
-            current_speaker_total_duration = sum(w['duration'] for w in wav_data_list)
-            m = current_speaker_total_duration / len(wav_data_list)
-            m_gamma = 30 / m
-            m_gamma_low = int(m_gamma)
-
-            with tqdm(total=len(wav_data_list), desc=f"{group_key}", unit="file") as pbar:
-                while wav_data_list:
-                    weights = self.calculate_weights(n_bucket, m_bucket, total_speakers, m_gamma_low)
-                    num_selected = random.choices(range(1, m_gamma_low + 1), weights=weights.values(), k=1)[0]
-                    num_selected = min(num_selected, len(wav_data_list))
-                    selected_files = random.sample(wav_data_list, num_selected)
-                    selected_durations = sum(d['duration'] for d in selected_files)
-
-                    if selected_durations < self.max_total_duration:
-                        current_combined = AudioSegment.empty()
-                        current_text = ""
-                        current_sr = ""
-                        current_n2gkplus = ""
-
-                        valid_files = []
-                        for data in selected_files:
-
-                            #real_path = os.path.join(rel_path, f"{dataset_name}/{data['wav']}") # Emilia_Dataset, f"{KO}/{B...."" or Emilia_Dataset, f"{KO}/{kss/wavs.."" 
-                            real_path = data['wav']
-                            if not os.path.exists(real_path):
-                                print(f"Warning: File not found: {real_path}")
-                                continue
-                            try:
-                                # Process based on extension
-                                if str(real_path).endswith('.mp3'):
-                                    wav = AudioSegment.from_mp3(real_path)
-                                else:  # If WAV file
-                                    wav = AudioSegment.from_wav(real_path)
-                            except FileNotFoundError:
-                                print(f"Warning: File not found, skipping: {real_path}")
-                                continue
-                            
-                            #wav = AudioSegment.from_wav(real_path)
-
-                            if len(current_combined) > 0:
-                                fade = 500
-                                current_combined = current_combined.fade_out(fade).append(wav.fade_in(fade))
-                            else:
-                                current_combined += wav
-
-                            current_text += " " + data['text']
-                            current_sr += " " + data['sr'] if data['sr'] is not None else ""
-                            current_n2gkplus += " " + data['N2gkPlus']
-
-
-                            #print(f"current_n2gkplus : {current_n2gkplus}")
-                            valid_files.append(data)
-
-                        if not valid_files:
-                            wav_data_list = [x for x in wav_data_list if x not in selected_files]
-                            continue
-
-                        bucket = int(selected_durations)
-                        n_bucket[bucket] += 1
-                        m_bucket[bucket] += 1
-
-                        if back_count < 5 and m_bucket[bucket] + 1 > m_threshold:
-                            back_count += 1
-                            continue
-                        else:
-                            back_count = 0
-
-                        selected_data.extend(valid_files)
-                        wav_data_list = [x for x in wav_data_list if x not in selected_data]
-
-                        speaker = valid_files[0]['speaker']
-                        if speaker not in file_counter:
-                            file_counter[speaker] = 1
-
-                        
-                        speaker_output_dir = wav_dir / speaker
-
-
-                        os.makedirs(speaker_output_dir, exist_ok=True)
-
-                        file_name = f"{file_counter[speaker]:06d}.wav"
-                        output_path = os.path.join(speaker_output_dir, file_name)
-
-
-                        current_combined.export(output_path, format="wav")
-
-                        jsonl_data = {
-                            #"wav": output_path.replace(output_dir, f"{label}_wavs_augmented_t_{t}_beta_{beta}"),
-                            "wav": output_path.replace('../data/',''),
-                            "duration": selected_durations,
-                            "text": current_text.strip(),
-                            "sr": current_sr.strip(),
-                            "N2gkPlus" : current_n2gkplus.strip(),
-                            "speaker": speaker
-                        }
-                        #print(f"final_jsonl_data : {jsonl_data}")
-                        #exit()
-                        jsonl_buffer.append(jsonl_data)
-
-                        file_counter[speaker] += 1
-                        pbar.update(len(valid_files))
-
-
-                # Print the number of samples aggregated for each interval (calculated as a percentage)
-                print("Sample distribution across 1~29 second buckets:")
-                total_samples_sum = sum(n_bucket.values())  # Sum of total samples
-                for i in range(0, 30):
-                    percent = (n_bucket[i] / total_samples_sum) * 100  # Calculate ratio by number of samples
-                    print(f"Bucket {i} seconds: {n_bucket[i]} samples ({percent:.2f}%)")
-
-            total_speakers -= 1
-
-        # Save all at the end
-        with open(input_jsonl_path, 'w', encoding='utf-8') as f:
-            for row in jsonl_buffer:
-                f.write(json.dumps(row, ensure_ascii=False) + "\n")
\ No newline at end of file
+        with MetadataWriter(output_meta, truncate_at=truncate_at, fsync_every=fsync_every) as meta:
+            if self.round_size is None:
+                plan, n_bucket = self.plan_appending(speaker_data, wav_dir)
+                planned = collections.Counter(group["row"]["speaker"] for group in plan)
+                for group_key in completed:
+                    self.check_resumed_speaker(group_key, planned[group_key], completed)
+                pending = collections.deque()
+                with self.open_writer() as writer:
+                    for group in tqdm([g for g in plan if g["row"]["speaker"] not in completed],
+                                      desc="Rendering appended WAVs", unit="file"):
+                        pending.append((self.render_group(group, writer), group["row"]))
+                        self.write_finished_rows(pending, meta)
+                self.write_finished_rows(pending, meta, wait=True)
+            else:
+                plan, n_bucket = self.append_by_rounds(speaker_data, wav_dir, render=True,
+                                                       completed=completed, meta=meta)
+
+        self.print_bucket_distribution(n_bucket)
+        print(f"Appended metadata saved to: {output_meta} ({meta.num_rows} rows written)")
+
+
+# Per-process DataAppender used by append_by_rounds' worker pool
+_WORKER_APPENDER = None
+
+
+def _init_appender_worker(max_total_duration, random_seed, crossfade_engine, writer_threads=2):
+    global _WORKER_APPENDER
+    _WORKER_APPENDER = DataAppender(max_total_duration=max_total_duration, random_seed=random_seed,
+                                    crossfade_engine=crossfade_engine, writer_threads=writer_threads)
+
+
+def _append_speaker_in_worker(task):
+    return _WORKER_APPENDER.append_speaker(*task)
@@ -3,6 +3,7 @@ from module.data_conditioning.audio_feature_extracting import AudioFeatureExtrac
 from module.data_conditioning.categorizing import LNCat
 from module.data_conditioning.normalization import N2gkPlus
 from module.coreset_selection.core_jamo_selecting import JamoBigram
+from module.coreset_selection.coverage_selecting import CoverageSelector
 from module.supplementary_finalization.data_appending import DataAppender
 
 # ─── CONFIG ────────────────────────────────────────────────────────────────────
@@ -18,8 +19,23 @@ RAW_JSONLS        = [
 
 # after phase1, we’ll merge all these normalized files here:
 MERGED_NORMALIZED = Path("../data/all_normalized_merged.jsonl")
-# where we’ll dump the global jamo counts CSV:
+# where we’ll dump the global jamo counts (binary table, memory-mapped on load):
+GLOBAL_TABLE      = Path("../data/total_jamo_counts.npy")
+# CSV export of the same counts, for inspection
 GLOBAL_CSV        = Path("../data/total_jamo_counts.csv")
+# add only datasets not yet listed in GLOBAL_TABLE's sources manifest, instead of rebuilding it
+INCREMENTAL_GLOBAL = False
+# hours per dataset for the coverage-maximizing CoverageSelector; None keeps the JamoBigram keep rule
+COVERAGE_BUDGET_HOURS = None
+# write *_appended_manifest.jsonl (source clips + fades, rendered on demand by
+# AppendedManifestDataset) instead of the appended WAVs
+APPEND_MANIFEST_ONLY = False
+# speakers per round of DataAppender's parallel mode (per-speaker seeds); None keeps the
+# sequential plan. APPEND_NUM_WORKERS > 1 needs a round size.
+APPEND_ROUND_SIZE = None
+APPEND_NUM_WORKERS = 1
+# continue an interrupted appending run from the speakers already in *_appended.jsonl
+APPEND_RESUME = False
 # ────────────────────────────────────────────────────────────────────────────────
 
 def phase1_and_merge() -> list[Path]:
@@ -62,58 +78,113 @@ def phase1_and_merge() -> list[Path]:
     return normalized_paths
 
 
-def build_global_jamo_csv():
+def phase2_jamobigram_applying(norm_paths: list[Path]) -> list[Path]:
     """
-    Read the single merged normalized JSONL, compute every
-    record’s JamoBigram counts (accumulating into self.total_…),
-    and dump those global counts out to GLOBAL_CSV.
+    Annotate each per-dataset *_normalized.jsonl exactly once:
+      3) JamoBigram applying → *_jbapplied.jsonl (+ sparse sidecar, bigram → record index)
+         and a partial count table *_total_table.npy per dataset
+    Returns the partial table paths, to be merged into GLOBAL_TABLE.
     """
-    print("\n>>> Computing + saving global JamoBigram counts …")
-    # we'll write an intermediate file with per‐record JamoBigram if you like,
-    # but only the CSV is strictly needed:
-    with_jamo = MERGED_NORMALIZED.with_name("all_with_jamo.jsonl")
+    table_paths = []
+    for norm in norm_paths:
+        stem = norm.stem.replace("_normalized", "")
+        table_path = norm.with_name(f"{stem}_total_table.npy")
 
-    jam = JamoBigram(
-        total_table_path=str(GLOBAL_CSV),     # where to save the global counts
-        num_workers=4
-    )
-    # this will read MERGED_NORMALIZED, annotate every line with "JamoBigram", update
-    # jam.total_jamo_pair_count, write out with_jamo, and then jam.save_total_counts() → GLOBAL_CSV
-    jam.apply_jamobigram(str(MERGED_NORMALIZED), str(with_jamo))
+        print(f"\n>>> Phase2 JamoBigram applying on {norm.name}")
+        jam = JamoBigram(
+            total_table_path=str(table_path),     # partial counts of this dataset
+            num_workers=4
+        )
+        jam.apply_jamobigram(
+            str(norm),
+            str(norm.with_name(f"{stem}_jbapplied.jsonl")),
+            sparse_output=str(norm.with_name(f"{stem}_jbapplied_sparse")),
+            index_output=str(norm.with_name(f"{stem}_jbapplied_index")),
+        )
+        table_paths.append(table_path)
+    return table_paths
+
+
+def build_global_jamo_csv(table_paths: list[Path], norm_paths: list[Path]):
+    """
+    Sum the per-dataset (or per-shard) partial count tables into
+    the global JamoBigram counts and dump them out to GLOBAL_TABLE
+    (plus a GLOBAL_CSV export).
+    Counts are additive, so this equals counting the merged corpus.
+    The merged datasets are recorded in GLOBAL_TABLE's sources manifest,
+    so INCREMENTAL_GLOBAL runs can add new datasets on top of it.
+    """
+    print("\n>>> Merging partial JamoBigram counts into global table …")
+    jam = JamoBigram(total_table_path=str(GLOBAL_TABLE))
+    sources = [(norm.stem.replace("_normalized", ""), norm) for norm in norm_paths]
+    merged_sources = jam.merge_total_tables(table_paths, sources)
+    jam.save_total_counts()
+    jam.save_sources(merged_sources)
+    jam.save_total_csv_table(str(GLOBAL_CSV))
+
+
+def update_global_jamo_csv(norm_paths: list[Path]):
+    """
+    Incremental alternative to phase2_jamobigram_applying + build_global_jamo_csv:
+    datasets already recorded in GLOBAL_TABLE's sources manifest are skipped (their
+    *_jbapplied.jsonl is reused), and only new ones are annotated and added.
+    """
+    print("\n>>> Updating global JamoBigram counts incrementally …")
+    jam = JamoBigram(total_table_path=str(GLOBAL_TABLE), num_workers=4)
+    for norm in norm_paths:
+        stem = norm.stem.replace("_normalized", "")
+        if jam.has_source(stem):
+            print(f"Already counted in {GLOBAL_TABLE.name}: {stem}")
+            continue
+        jam.apply_jamobigram_incremental(
+            str(norm),
+            str(norm.with_name(f"{stem}_jbapplied.jsonl")),
+            source_name=stem,
+            sparse_output=str(norm.with_name(f"{stem}_jbapplied_sparse")),
+            index_output=str(norm.with_name(f"{stem}_jbapplied_index")),
+        )
+    jam.load_total_table(str(GLOBAL_TABLE))
+    jam.save_total_csv_table(str(GLOBAL_CSV))
 
 
 def phase2_selection_and_appending(norm_paths: list[Path]):
     """
-    For each of your per‐dataset *_normalized.jsonl:
-      4) load jamo‐counts from GLOBAL_CSV and filter → *_selected.jsonl
-      5) data appending / wav concatenation → *_appended.jsonl
+    For each of your per‐dataset *_normalized.jsonl, reusing its *_jbapplied.jsonl:
+      4) load jamo‐counts from GLOBAL_TABLE and filter → *_selected.jsonl
+      5) data appending / wav concatenation → *_appended.jsonl (or *_appended_manifest.jsonl)
     """
     for norm in norm_paths:
         stem     = norm.stem.replace("_normalized", "")
         jbapplied = norm.with_name(f"{stem}_jbapplied.jsonl")
+        jbsparse = norm.with_name(f"{stem}_jbapplied_sparse")
         selected = norm.with_name(f"{stem}_selected.jsonl")
         appended = norm.with_name(f"{stem}_appended.jsonl")
+        appended_manifest = norm.with_name(f"{stem}_appended_manifest.jsonl")
 
         print(f"\n>>> Phase2 on {norm.name}")
-        print("Stpe 3: Jamo Bigram Applying each")
-        # 3) Jamo Bigram applying
-        jam = JamoBigram(
-            total_table_path=str(norm.with_name(f"{stem}_total_table.csv")),     # where to save the global counts
-            num_workers=4
-            )
-        jam.apply_jamobigram(str(norm), str(jbapplied))
-        # 4) core‐set filtering (loads GLOBAL_CSV under the hood)
+        # 4) core‐set filtering (loads GLOBAL_TABLE under the hood)
         print("Step 4: core-set filtering")
-        JamoBigram(
-            t=500,
-            beta=0.0001,
-            csv_total_table=str(GLOBAL_CSV),
-            num_workers=4
-        ).run_selection(str(jbapplied), str(selected))
+        if COVERAGE_BUDGET_HOURS is not None:
+            CoverageSelector(
+                budget_hours=COVERAGE_BUDGET_HOURS,
+                cap=500
+            ).run_selection(str(jbapplied), str(selected), sparse_input=str(jbsparse))
+        else:
+            JamoBigram(
+                t=500,
+                beta=0.0001,
+                csv_total_table=str(GLOBAL_TABLE),
+                num_workers=4,
+                selection_engine="vectorized"
+            ).run_selection(str(jbapplied), str(selected), sparse_input=str(jbsparse))
 
         # 5) create appended audio + JSONL
         print("Step: Data Appending")
-        DataAppender().run_appending(str(selected), str(appended))
+        appender = DataAppender(round_size=APPEND_ROUND_SIZE, num_workers=APPEND_NUM_WORKERS)
+        if APPEND_MANIFEST_ONLY:
+            appender.run_manifest(str(selected), str(appended_manifest))
+        else:
+            appender.run_appending(str(selected), str(appended), resume=APPEND_RESUME)
 
 
 if __name__ == "__main__":
@@ -124,8 +195,12 @@ if __name__ == "__main__":
         Path("../data/emilia/emilia_normalized.jsonl"),
         Path("../data/kss/kss_normalized.jsonl")
     ]
-    # Build global counts CSV from merged normalized data
-    build_global_jamo_csv()
+    # Annotate every dataset once, then merge the partial counts into GLOBAL_TABLE
+    if INCREMENTAL_GLOBAL:
+        update_global_jamo_csv(norm_list)
+    else:
+        partial_tables = phase2_jamobigram_applying(norm_list)
+        build_global_jamo_csv(partial_tables, norm_list)
 
     # Phase 2: selection & appending on each normalized file
     phase2_selection_and_appending(norm_list)